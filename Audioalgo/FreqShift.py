@@ -1,81 +1,172 @@
 #!/usr/bin/env python3
 import os
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from math import gcd
 from pathlib import Path
-from typing import Union
+from typing import BinaryIO, Union
 import numpy as np
-import torch
 import librosa, soundfile as sf
-from scipy.signal import butter, lfilter
+from scipy.signal import butter, firwin, sosfilt, resample_poly
 from scipy.signal import hilbert
-from normalization import normalize_audio
+from dsp_utils import peak_normalize
 
+SR_OUT = 8000
+
+# Filter designs depend only on their (hashable) arguments, so they are
+# computed once per parameter set and shared; callers must not modify them.
+@lru_cache(maxsize=32)
 def _butter_bandpass(sr: int, center_hz: float = 250.0, q: float = 1.0, order: int = 4):
     bw = center_hz / q
     low_hz  = max(center_hz - bw/2, 1.0)
     high_hz = min(center_hz + bw/2, sr/2 - 1)
     wn = [low_hz/(sr/2), high_hz/(sr/2)]
-    return butter(order, wn, btype="band")
+    return butter(order, wn, btype="band", output="sos")
 
+@lru_cache(maxsize=32)
 def _butter_highpass(sr: int, cutoff_hz: float = 10.0, order: int = 2):
     wn = cutoff_hz / (sr/2)
-    return butter(order, wn, btype="high")
-
-def process_file(in_wav: Union[str, Path], out_wav: Union[str, Path], centre_hz: float = 250.0, q: float = 1.0) -> None:
-    sr_out = 8000
+    return butter(order, wn, btype="high", output="sos")
+
+@lru_cache(maxsize=16)
+def _get_sos(sr: int, centre_hz: float = 250.0, q: float = 1.0):
+    # 10 Hz high-pass followed by the band-pass, as one SOS cascade
+    return np.vstack([_butter_highpass(sr, cutoff_hz=10.0), _butter_bandpass(sr, centre_hz, q)])
+
+@lru_cache(maxsize=8)
+def _resample_plan(orig_sr: int, target_sr: int):
+    # Same anti-aliasing FIR resample_poly designs by default, built once per rate pair
+    g = gcd(orig_sr, target_sr)
+    up, down = target_sr // g, orig_sr // g
+    max_rate = max(up, down)
+    taps = firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+    return up, down, taps
+
+def _octave_shifts(y: np.ndarray, sr: int, octaves=(1, 2), n_fft: int = 2048, hop_length: int = 512):
+    """Pitch-shift y down by each number of octaves, sharing one STFT between the shifts.
+
+    Mirrors librosa.effects.pitch_shift(y, n_steps=-12 * k): phase-vocoder
+    time-stretch by 2**k, then resample back to sr. Because the stretch
+    factor is an integer, the resample is a plain polyphase upsample.
+    """
+    D = librosa.stft(y, n_fft=n_fft, hop_length=hop_length)
+    shifted = []
+    for k in octaves:
+        rate = 2 ** k
+        D_stretch = librosa.phase_vocoder(D, rate=rate, hop_length=hop_length, n_fft=n_fft)
+        y_stretch = librosa.istft(D_stretch, hop_length=hop_length, n_fft=n_fft,
+                                  dtype=y.dtype, length=int(round(len(y) / rate)))
+        y_shift = resample_poly(y_stretch, up=rate, down=1).astype(y.dtype, copy=False)
+        shifted.append(librosa.util.fix_length(y_shift, size=len(y)))
+    return shifted
+
+def process_file(in_wav: Union[str, Path, BinaryIO], out_wav: Union[str, Path, BinaryIO], centre_hz: float = 250.0, q: float = 1.0) -> None:
     # Load (mono) using native sample rate
-    y, sr = librosa.load(in_wav, sr=None, mono=True)
+    y, sr = librosa.load(in_wav, sr=None, mono=True, dtype=np.float32)
+    process_array(y, sr, out_wav, centre_hz=centre_hz, q=q)
 
-    # Peak-normalize via your torch-based function
-    wav_tensor = torch.from_numpy(y).float().unsqueeze(0)
-    y_norm_t = normalize_audio(wav_tensor, normalize=True, strategy='peak')
-    y = y_norm_t.squeeze(0).numpy()
+def process_array(samples: np.ndarray, sr: int, out_wav: Union[str, Path, BinaryIO], centre_hz: float = 250.0, q: float = 1.0) -> None:
+    """process_file() on already decoded float32 samples, shape (frames,) or (frames, channels); not modified"""
+    sr_out = SR_OUT
+    y = samples.mean(axis=1, dtype=np.float32) if samples.ndim > 1 else samples
 
-    # Octave-shift copies
-    y_1ot = librosa.effects.pitch_shift(y, sr=sr, n_steps=-12, res_type="kaiser_best")
-    y_2ot = librosa.effects.pitch_shift(y, sr=sr, n_steps=-24, res_type="kaiser_best")
+    # Peak-normalize with 1 dB headroom (normalize_audio's 'peak' defaults),
+    # directly in numpy
+    y = peak_normalize(y, headroom_db=1.0)
 
-    # Mix
-    mix = y + y_1ot + y_2ot
+    # Octave-shift copies (-12 and -24 semitones)
+    y_1ot, y_2ot = _octave_shifts(y, sr, octaves=(1, 2))
+
+    # Mix in place into the buffer of the first shifted copy
+    mix = y_1ot
+    mix += y_2ot
+    mix += y
 
     # Normalize the mixed signal (RMS-based)
-    rms = np.sqrt(np.mean(mix ** 2) + 1e-12)  # Add epsilon to avoid division by zero
-    mix /= rms * np.sqrt(2)  # Normalize RMS to √2 for consistent loudness
+    # einsum reduces the float32 buffer without a mix**2 temporary; accumulate in float64
+    rms = np.sqrt(np.einsum('i,i->', mix, mix, dtype=np.float64) / mix.size + 1e-12)  # Add epsilon to avoid division by zero
+    gain = 1.0 / (rms * np.sqrt(2))  # Normalize RMS to √2 for consistent loudness
 
-    # Apply high-pass filter first to remove problematic low frequencies
+    # High-pass first to remove problematic low frequencies, then band-pass.
     # The paper noted that <10 Hz components caused "muffled" sensations
-    b_hp, a_hp = _butter_highpass(sr, cutoff_hz=10.0)
-    mix = lfilter(b_hp, a_hp, mix)
-
-    # Band-pass
-    b, a = _butter_bandpass(sr, centre_hz, q)
-    mix_bp = lfilter(b, a, mix)
+    # Both filters run as one cascade of second-order sections in a single
+    # pass; the RMS gain is folded into the first section's numerator.
+    sos = _get_sos(sr, centre_hz, q).copy()
+    sos[0, :3] *= gain
+    mix_bp = sosfilt(sos, mix)
 
-    # Resample
-    mix_bp = librosa.resample(mix_bp, orig_sr=sr, target_sr=sr_out)
+    # Resample (44.1 kHz -> 8 kHz is up=80, down=441), then drop to float32
+    # once on the (much smaller) 8 kHz buffer
+    up, down, taps = _resample_plan(sr, sr_out)
+    mix_bp = resample_poly(mix_bp, up, down, window=taps).astype(np.float32, copy=False)
 
     # Clip for safety
-    mix_bp = np.clip(mix_bp, -1.0, 1.0)
-
-    # Write out
-    out_folder = Path(out_wav).parent
-    out_folder.mkdir(parents=True, exist_ok=True)
-    sf.write(out_wav, mix_bp.astype(np.float32), sr_out, subtype='PCM_16')
+    np.clip(mix_bp, -1.0, 1.0, out=mix_bp)
+
+    # Write out (to a path, or WAV into a binary file-like object)
+    if hasattr(out_wav, 'write'):
+        out_format = 'WAV'
+    else:
+        out_format = None
+        Path(out_wav).parent.mkdir(parents=True, exist_ok=True)
+    with sf.SoundFile(out_wav, 'w', samplerate=sr_out, channels=1, subtype='PCM_16', format=out_format) as f:
+        f.write(mix_bp)
+
+
+def _init_worker(centre_hz: float, q: float, sr: int = 44100):
+    # Design the filters once per worker for the expected (ESC-50) sample rate
+    _get_sos(sr, centre_hz, q)
+    _resample_plan(sr, SR_OUT)
+
+def process_folder(in_dir: Union[str, Path], out_dir: Union[str, Path], centre_hz: float = 250.0, q: float = 1.0,
+                   max_workers: Union[int, None] = None) -> int:
+    """Process every .wav file in in_dir in parallel, writing same-named files to out_dir.
+
+    Returns the number of files processed successfully.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with os.scandir(in_dir) as it:
+        inputs = sorted(entry.path for entry in it
+                        if entry.name.lower().endswith(".wav") and entry.is_file())
+    print(f"Processing {len(inputs)} files from '{in_dir}'...")
+
+    failures = 0
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), initializer=_init_worker,
+                             initargs=(centre_hz, q)) as executor:
+        futures = {
+            executor.submit(process_file, path, out_dir / os.path.basename(path), centre_hz, q): path
+            for path in inputs
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                failures += 1
+                print(f"Error processing '{futures[future]}': {e}")
+    return len(inputs) - failures
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
-        description="Generate a haptic wav from a single audio file using frequency shifting."
+        description="Generate a haptic wav from an audio file (or a folder of them) using frequency shifting."
     )
     parser.add_argument(
         "input_file",
         type=str,
-        help="Path to the input WAV file."
+        help="Path to the input WAV file, or a folder of WAV files."
     )
     parser.add_argument(
         "output_file",
         type=str,
-        help="Path for the output haptic WAV file."
+        help="Path for the output haptic WAV file, or the output folder when the input is a folder."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes for folder input (default: CPU count)."
     )
     args = parser.parse_args()
 
@@ -84,6 +175,11 @@ if __name__ == "__main__":
         print(f"Error: Input file '{args.input_file}' does not exist!")
         exit(1)
 
+    if input_path.is_dir():
+        done = process_folder(input_path, args.output_file, centre_hz=250.0, q=1.0, max_workers=args.workers)
+        print(f"Done. {done} files written to '{args.output_file}'.")
+        exit(0)
+
     # Ensure output directory exists
     output_path = Path(args.output_file)
     output_path.parent.mkdir(parents=True, exist_ok=True)
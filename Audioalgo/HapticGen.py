@@ -3,14 +3,29 @@ import math
 import os
 import soundfile as sf
 import argparse
-import torch
 import argparse
 from pathlib import Path
-from normalization import normalize_audio
+from dsp_utils import njit, lut_sin, peak_normalize, NUMBA_AVAILABLE
 
 
 WANTED_BIN_SIZE_SEC: float = 0.010 # 10ms, window length
 BASE_FREQ: float = 200.0 # 200Hz, center pitch
+
+@njit(cache=True, fastmath=True)
+def _nco_render(rms, output_sample_rate, base_freq):
+    # Compiled per-sample NCO over a precomputed RMS envelope; keeps the scalar phase accumulator wrapped mod 2π on every step
+    phase_acc = 0.0 # phase accumulator for the sine wave
+    output = np.zeros(rms.size) # output array to hold the generated audio samples
+    two_pi = 2.0 * math.pi
+    for i in range(rms.size):
+        freq_offset = (rms[i] - 0.3) * 100.0
+
+        phase_delta = two_pi * (base_freq + freq_offset) / output_sample_rate
+        phase_acc = (phase_acc + phase_delta) % two_pi # Keep phase_acc in the range 0, 2π
+
+        output[i] = rms[i] * lut_sin(phase_acc) # table sine; haptic output needs ~16-bit accuracy at most
+    return output
+
 def amp_env_on_wav_norm(wav_norm: np.ndarray, input_sample_rate: int, output_sample_rate: int): # wav_norm is a mono audio clip already normalized to [-1.0, 1.0]
     wav_norm = wav_norm.squeeze() # (N,1) to (N,)
 
@@ -20,8 +35,8 @@ def amp_env_on_wav_norm(wav_norm: np.ndarray, input_sample_rate: int, output_sam
     num_bins = num_samples // samples_per_bin # number of bins we can create from the input audio
     # print(f"wav_norm.shape: {wav_norm.shape}, samples_per_bin: {samples_per_bin}, num_bins: {num_bins}")
 
-    wav_chunks = np.array_split(wav_norm, num_bins) # split the audio into chunks of equal size
-    rms_bins = np.array([np.sqrt(np.mean(chunk ** 2)) for chunk in wav_chunks]) # calculate the RMS of each chunk
+    wav_chunks = wav_norm[:num_bins * samples_per_bin].reshape(num_bins, samples_per_bin, -1) # view the audio as equal-size bins (the <1 bin tail is dropped); trailing axis holds the channels of multichannel input
+    rms_bins = np.sqrt(np.square(wav_chunks).mean(axis=(1, 2))) # calculate the RMS of every bin (over all its channels, as before) in one reduction
     #assert num_bins == len(rms_bins), f"num_bins: {num_bins}, len(rms_bins): {len(rms_bins)}"
     rms_max = np.max(rms_bins)  # find the maximum RMS value across all bins
     rms_norm = np.sqrt(2)  # normalize RMS to a value that will give us a peak amplitude of 1.0 when multiplied by the sine wave
@@ -30,48 +45,43 @@ def amp_env_on_wav_norm(wav_norm: np.ndarray, input_sample_rate: int, output_sam
     out_samples = int(duration_sec * output_sample_rate) # number of samples in the output audio
     # print(f"duration_sec: {duration_sec}, out_samples: {out_samples}, rms_max: {rms_max}, rms_norm_amp: {rms_norm_amp}")
 
-    phase_acc = 0.0 # phase accumulator for the sine wave
-    output = np.zeros(out_samples) # output array to hold the generated audio samples
-    for i in range(out_samples):
-        t = i / output_sample_rate # current time in seconds for the output sample
-        t_prog = t / duration_sec # progress through the duration of the input audio
+    # Sample -> bin interpolation table, depends only on the sizes so it is built once per file, outside the synthesis loop
+    bin_fi = np.arange(out_samples) * (num_bins / (duration_sec * output_sample_rate)) # fractional bin index based on the progress through the input audio
+    bin_lo = bin_fi.astype(np.int64) # lower bin index
+    bin_hi = np.minimum(num_bins - 1, bin_lo + 1) # upper bin index, ensuring we don't go out of bounds
+    bin_fr = bin_fi - bin_lo # fractional part of the bin index
+    rms = (rms_bins[bin_lo] * (1.0 - bin_fr) + rms_bins[bin_hi] * bin_fr) * rms_norm_amp # interpolate RMS between the two bins
 
-        bin_fi = t_prog * num_bins # fractional bin index based on the progress through the input audio
-        bin_lo = int(bin_fi) # lower bin index
-        bin_hi = min(num_bins - 1, int(math.ceil(bin_fi))) # upper bin index, ensuring we don't go out of bounds
-        bin_fr = bin_fi - bin_lo # fractional part of the bin index
-        rms = (rms_bins[bin_lo] * (1.0 - bin_fr) + rms_bins[bin_hi] * bin_fr) * rms_norm_amp # interpolate RMS between the two bins
-        # freq = 0.0 # no freq bins
-        freq_offset = (rms - 0.3) * 100.0 # Map the instantaneous RMS to a small frequency offset: When rms = 0.3 → offset 0 Hz. Each +0.01 RMS raises the pitch by +1 Hz.
+    if NUMBA_AVAILABLE:
+        return _nco_render(rms, output_sample_rate, BASE_FREQ)
 
-        phase_delta = 2.0 * math.pi * (BASE_FREQ + freq_offset) / output_sample_rate # Numerically controlled oscillator (Direct digital synthesis), so can change freq without phase discontinuity
-        phase_acc = (phase_acc + phase_delta) % (2.0 * math.pi) # Keep phase_acc in the range 0, 2π
+    # Vectorised NCO (no numba): same phase accumulation as the kernel, done as whole-array ops
+    freq_offset = (rms - 0.3) * 100.0 # Map the instantaneous RMS to a small frequency offset: When rms = 0.3 → offset 0 Hz. Each +0.01 RMS raises the pitch by +1 Hz.
 
-        sample = rms * math.sin(phase_acc) # Generate the sine wave sample at the current phase
+    phase_delta = 2.0 * np.pi * (BASE_FREQ + freq_offset) / output_sample_rate # Numerically controlled oscillator (Direct digital synthesis), so can change freq without phase discontinuity
+    phase_acc = np.cumsum(phase_delta) # running phase; float64 keeps it exact enough for sin() over minutes of audio, so no per-step wrap
+    np.mod(phase_acc, 2.0 * np.pi, out=phase_acc) # Keep phase_acc in the range 0, 2π
 
-        output[i] = sample
+    output = rms * np.sin(phase_acc) # Generate the sine wave samples at the accumulated phase
 
     return output
 
 def process_file(input_path: str, output_path: str):
+    wav_data, sr = sf.read(input_path, dtype='float32')
+    process_array(wav_data, sr, output_path)
+    in_name = os.path.basename(input_path) if isinstance(input_path, (str, os.PathLike)) else '<in-memory>'
+    out_name = output_path if isinstance(output_path, (str, os.PathLike)) else '<in-memory>'
+    print(f"Processed: '{in_name}' -> '{out_name}'")
+
+def process_array(wav_data: np.ndarray, sr: int, output_path: str):
+    # Already decoded float32 samples, as sf.read returns them; the array is not modified
     output_sample_rate = 8000
-    wav_data, sr = sf.read(input_path)
-    wav_tensor = torch.from_numpy(wav_data).float().unsqueeze(0)
-
-    wav_norm_tensor = normalize_audio(
-        wav_tensor,
-        normalize=True,
-        strategy="peak",
-        peak_clip_headroom_db=0,
-        peak_normalize_db_clamp=0
-    )
-
-    wav = wav_norm_tensor.squeeze(0).numpy()
+    wav = peak_normalize(wav_data) # peak to 0 dBFS, no headroom (was normalize_audio(strategy="peak") on a tensor)
     env_signal = amp_env_on_wav_norm(wav, sr, output_sample_rate)
 
-    sf.write(output_path, env_signal, output_sample_rate, subtype='PCM_16')
+    sf.write(output_path, env_signal, output_sample_rate, subtype='PCM_16',
+             format='WAV' if hasattr(output_path, 'write') else None)
     # sf.write(output_path, env_signal, output_sample_rate, subtype='PCM_U8')
-    print(f"Processed: '{os.path.basename(input_path)}' -> '{output_path}'")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -9,11 +9,11 @@ Input  : mono 44 100 Hz, 16-bit WAV
 Output : mono 8 000 Hz, 8-bit WAV
 """
 import wave, struct, sys, math, argparse
+from functools import lru_cache
 import numpy as np
-from scipy.signal import find_peaks
+from scipy.fft import rfft, rfftfreq
 import soundfile as sf
-import torch
-from normalization import normalize_audio
+from dsp_utils import peak_gain, peak_normalize
 import os
 
 # ---------------------------------------------------------------------------
@@ -29,6 +29,8 @@ CV = 1 # a simple scaling factor for Ra
 CL = 0.1 # for music
 OL = 3.8 # for music
 c = 1.37
+ROUGHNESS_TILE = 64 # peaks per side of a roughness pair block
+STREAM_BLOCKS = 64 # analysis blocks read and transformed per batch (~2.8 s of audio)
 
 #  games and movies
 C_fullband = 0.065
@@ -49,6 +51,17 @@ def iso60phon(f):
     """60-phon SPL (dB) via linear interpolation."""
     return np.interp(f, _ISO_FREQ, _ISO_SPL60, left=_ISO_SPL60[0], right=_ISO_SPL60[-1])
 
+# ---------------------------------------------------------------------------
+# 0.  Shared frame spectrum (one FFT per block, used by both analyses)
+@lru_cache(maxsize=4)
+def _rfft_freqs(n):
+    """Frequency axis of an n-sample frame; identical for every frame, so built once."""
+    return rfftfreq(n, 1/AUDIO_SR)
+
+def frame_spectrum(frame, workers=None):
+    """Magnitude spectrum and frequency axis of one frame, or of a (num_blocks, n) stack of frames."""
+    return np.abs(rfft(frame, axis=-1, workers=workers)), _rfft_freqs(frame.shape[-1])
+
 # ---------------------------------------------------------------------------
 # 1.  Per-frame auditory LOUDNESS, eq.(1)
 def auditory_loudness(frame, content):
@@ -56,53 +69,76 @@ def auditory_loudness(frame, content):
       - For game/movie: full band up to 6400 Hz, C=0.065
       - For music: only up to 200 Hz, C=1.91
     """
+    mag, freqs = frame_spectrum(frame)
+    return _loudness_from_spec(mag, freqs, content)
+
+@lru_cache(maxsize=8)
+def _loudness_grid(n, content):
+    """Band mask and ISO-226 curve on the fixed n-sample frequency grid, built once per content type."""
+    f_max = F_bass if content == "music" else F_fullband
+    freqs = _rfft_freqs(n)
+    mask  = (freqs >= 25) & (freqs <= f_max)
+    return mask, iso60phon(freqs[mask])
+
+def _loudness_from_spec(mag, freqs, content):
     if content == "music":
         C_use = C_bass
-        f_max = F_bass
     else:
         C_use = C_fullband
-        f_max = F_fullband
 
-    mag = np.abs(np.fft.rfft(frame))
-    freqs = np.fft.rfftfreq(frame.size, 1/AUDIO_SR)
-    mask  = (freqs >= 25) & (freqs <= f_max)
-    mag = mag[mask]
-    freqs = freqs[mask]
+    # freqs[1] is the bin spacing AUDIO_SR/n, which recovers the frame size for the cache key
+    mask, af = _loudness_grid(int(round(AUDIO_SR / freqs[1])), content)
+    mag = mag[..., mask]  # works per frame or across a stack of frames
 
     db = 20 * np.log10(c * mag + 1e-12)
-    af = iso60phon(freqs)
-    loudness = C_use * np.sum(db/af)
-    return max(0.0, loudness)
+    loudness = C_use * np.sum(db/af, axis=-1)
+    return np.maximum(0.0, loudness)
 
 # ---------------------------------------------------------------------------
 # 2.  Per-frame auditory ROUGHNESS, eq.(2)
 def auditory_roughness(frame, peak_db=-40.0): # -20 will make loud part stands out more
-    mag = np.abs(np.fft.rfft(frame))
-    freqs = np.fft.rfftfreq(frame.size, 1/AUDIO_SR)
+    mag, freqs = frame_spectrum(frame)
+    return _roughness_from_spec(mag, freqs, peak_db)
 
+def _roughness_from_spec(mag, freqs, peak_db=-40.0):
     mask = (freqs >= 25) & (freqs <= 6400)
     mag = mag[mask]
     freqs = freqs[mask]
 
     db = 20 * np.log10(mag + 1e-12)
     thresh = db.max() + peak_db
-    peaks, _ = find_peaks(db, height=thresh)
+    # strict local maxima at or above the threshold, as three vector comparisons
+    inner = db[1:-1]
+    peaks = np.flatnonzero((inner > db[:-2]) & (inner > db[2:]) & (inner >= thresh)) + 1
 
     f = freqs[peaks]
     x = mag[peaks]
-    R = 0.0
+    if f.size < 2:
+        return 0.0
 
-    for i in range(len(f)):
-        for j in range(i+1, len(f)):
-            f1, f2 = f[i], f[j]
-            x1, x2 = x[i], x[j]
-            xm, xM = min(x1,x2), max(x1,x2)
-            fd = abs(f2 - f1)
-            s = 0.24 / (0.0207*min(f1, f2) + 18.96)
-            term = ((xm*xM)**0.1 / 2.0) * (2*xm/(xm+xM))**3.11
-            R += term * (math.exp(-3.5*s*fd) - math.exp(-5.75*s*fd))
+    # Sethares dissonance over peak pairs, in ROUGHNESS_TILE x ROUGHNESS_TILE blocks
+    # so the temporaries stay cache-sized; only i < j is summed
+    K = f.size
+    R = 0.0
+    for i0 in range(0, K, ROUGHNESS_TILE):
+        i1 = min(i0 + ROUGHNESS_TILE, K)
+        for j0 in range(i0, K, ROUGHNESS_TILE):
+            j1 = min(j0 + ROUGHNESS_TILE, K)
+            term = _sethares_block(f[i0:i1], x[i0:i1], f[j0:j1], x[j0:j1])
+            R += float(np.triu(term, k=1).sum()) if j0 == i0 else float(term.sum())
     return R
 
+def _sethares_block(fa, xa, fb, xb):
+    """Sethares pair terms between peaks (fa, xa) and (fb, xb), shape (len(fa), len(fb))."""
+    f1, f2 = fa[:, None], fb[None, :]
+    x1, x2 = xa[:, None], xb[None, :]
+    xm, xM = np.minimum(x1, x2), np.maximum(x1, x2)
+    fd = np.abs(f2 - f1)
+    s = 0.24 / (0.0207*np.minimum(f1, f2) + 18.96)
+    term = ((xm*xM)**0.1 / 2.0) * (2*xm/(xm+xM))**3.11
+    term *= np.exp(-3.5*s*fd) - np.exp(-5.75*s*fd)
+    return term
+
 # ---------------------------------------------------------------------------
 # 3.  Map (La, Ra) → (Iv, Rv)
 def perceptual_targets(La, Ra, content):
@@ -117,6 +153,12 @@ def perceptual_targets(La, Ra, content):
     Rv = CV * Ra                               
     return max(0, Iv), Rv
 
+def _silent_without_roughness(La, content):
+    """True when perceptual_targets() gives Iv = 0 for any Ra, so roughness need not be computed."""
+    if content == "music":
+        return CL*La - OL <= 0   # eq.(8) does not use Ra
+    return La <= 0               # eq.(7): CR*sqrt(0)*Ra^2 - OR < 0
+
 # ---------------------------------------------------------------------------
 # 4.  Invert Iv, Rv
 def amplitudes_from_percepts(Iv, Rv):
@@ -160,59 +202,99 @@ def synth_vibration(a1, a2, n_samples):
 # ---------------------------------------------------------------------------
 # 6.  WAV helpers
 def read_wav_mono_44k(fname):
-    wav_data, sr = sf.read(fname) 
+    wav_data, sr = sf.read(fname, dtype="float32")
     if wav_data.ndim > 1:
         wav_data = wav_data.mean(axis=1)
-    wav_tensor = torch.from_numpy(wav_data).float().unsqueeze(0) 
-    wav_norm_tensor = normalize_audio(
-        wav_tensor,
-        normalize=True,
-        strategy="peak",
-        peak_clip_headroom_db=0,
-        peak_normalize_db_clamp=0
-    )
-    return wav_norm_tensor.squeeze(0).numpy().astype("float32")
+    return peak_normalize(wav_data)
+
+def _mono_blocks(f, blocksize):
+    """Yield float32 mono blocks of an open sf.SoundFile, averaging channels like read_wav_mono_44k."""
+    for block in f.blocks(blocksize=blocksize, dtype="float32", always_2d=True):
+        yield block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
 
 # ---------------------------------------------------------------------------
 # 7.  Main pipeline
-def process_file(in_wav, out_wav, overlap=0.0, content="game"):
+def process_file(in_wav, out_wav, overlap=0.0, content="game", workers=-1):
     """
     Paper’s method: FRAME_S=4096 (≈93 ms), hop=4096 (no overlap), 
     C stays at 0.065, rectangular blocks.
+    workers: threads for the batched FFTs (-1: all CPUs; pass 1 when several
+    translations already run side by side).
+    """
+    # The input is streamed in batches of STREAM_BLOCKS blocks instead of
+    # being loaded whole; only the (much smaller) 8 kHz output is kept.
+    with sf.SoundFile(in_wav) as f:
+        # Pass 1: global peak of the mono mix, for the same peak normalisation as read_wav_mono_44k
+        wav_max = 0.0
+        for chunk in _mono_blocks(f, FRAME_S * STREAM_BLOCKS):
+            if chunk.size:
+                wav_max = max(wav_max, float(np.max(np.abs(chunk))))
+
+        # Pass 2: analysis and synthesis, one batch at a time
+        f.seek(0)
+        vib_full = _render(_mono_blocks(f, FRAME_S * STREAM_BLOCKS), f.frames, peak_gain(wav_max), content, workers)
+
+    _write_vibration(vib_full, out_wav)
+
+def process_array(samples, sr, out_wav, overlap=0.0, content="game", workers=-1):
     """
-    audio = read_wav_mono_44k(in_wav) 
+    process_file() on already decoded float32 samples, shape (frames,) or
+    (frames, channels); the array is not modified. As in process_file the
+    input is taken to be at AUDIO_SR. workers as for process_file().
+    """
+    mono = samples.mean(axis=1, dtype=np.float32) if samples.ndim > 1 else samples
+    wav_max = float(np.max(np.abs(mono))) if mono.size else 0.0
+    batch = FRAME_S * STREAM_BLOCKS
+    chunks = (mono[i:i + batch] for i in range(0, mono.size, batch))
+    _write_vibration(_render(chunks, mono.size, peak_gain(wav_max), content, workers), out_wav)
+
+def _render(chunks, n_frames, gain, content, workers=-1):
+    """8 kHz vibration for n_frames of mono audio, given as consecutive chunks of whole STREAM_BLOCKS batches"""
     HOP_S = FRAME_S 
-    n_out_total = int(np.ceil(len(audio) * VIB_SR / AUDIO_SR))
+    n_out  = int(round(FRAME_S * VIB_SR / AUDIO_SR))
+    n_out_total = int(np.ceil(n_frames * VIB_SR / AUDIO_SR))
     vib_full = np.zeros(n_out_total, dtype=np.float32)
 
-    for start in range(0, len(audio), HOP_S):
-        block = audio[start:start+FRAME_S]
-        if block.size == 0:
-            break
-        if block.size < FRAME_S:
-            # zero-pad last block
-            block = np.pad(block, (0, FRAME_S - block.size), "constant")
-
-        # 1) perceptual analysis
-        La = auditory_loudness(block, content)
-        Ra = auditory_roughness(block)
-        Iv, Rv = perceptual_targets(La, Ra, content)
-        a1, a2 = amplitudes_from_percepts(Iv, Rv)
-
-        # print(f"Processing block: start={start}, La={La:.2f}, Ra={Ra:.2f}, " f"Iv={Iv:.2f}, Rv={Rv:.2f}, a1={a1:.4f}, a2={a2:.4f}")
-
-        # 2) synth at 8 kHz
-        n_out  = int(round(FRAME_S * VIB_SR / AUDIO_SR))
-        vib_seg = synth_vibration(a1, a2, n_out)
-
-        # 3) place contiguously without per-segment normalization
-        out_start = int(round(start * VIB_SR / AUDIO_SR))
-        out_end   = out_start + n_out
-        if out_end > n_out_total:
-            vib_full[out_start:] += vib_seg[: n_out_total - out_start]
-        else:
-            vib_full[out_start:out_end] += vib_seg
-
+    b0 = 0
+    for chunk in chunks:
+        # Blocks are contiguous (hop == frame), so the batch, zero-padded to a
+        # whole number of blocks, reshapes straight into a (num_blocks, FRAME_S) stack
+        num_blocks = -(-chunk.size // HOP_S)
+        blocks = np.zeros(num_blocks * FRAME_S, dtype=np.float32)
+        np.multiply(chunk, gain, out=blocks[:chunk.size])
+        blocks = blocks.reshape(num_blocks, FRAME_S)
+
+        # One batched FFT per batch (threaded over `workers`); loudness is evaluated across its blocks at once
+        mag_all, freqs = frame_spectrum(blocks, workers=workers)
+        La_all = _loudness_from_spec(mag_all, freqs, content)
+
+        for b in range(num_blocks):
+            start = (b0 + b) * HOP_S
+
+            # 1) perceptual analysis (spectrum shared by loudness and roughness)
+            La = float(La_all[b])
+            if _silent_without_roughness(La, content):
+                continue  # Iv <= 0 whatever Ra is -> a1 = a2 = 0, nothing to add
+            Ra = _roughness_from_spec(mag_all[b], freqs)
+            Iv, Rv = perceptual_targets(La, Ra, content)
+            a1, a2 = amplitudes_from_percepts(Iv, Rv)
+
+            # print(f"Processing block: start={start}, La={La:.2f}, Ra={Ra:.2f}, " f"Iv={Iv:.2f}, Rv={Rv:.2f}, a1={a1:.4f}, a2={a2:.4f}")
+
+            # 2) synth at 8 kHz
+            vib_seg = synth_vibration(a1, a2, n_out)
+
+            # 3) place contiguously without per-segment normalization
+            out_start = int(round(start * VIB_SR / AUDIO_SR))
+            out_end   = out_start + n_out
+            if out_end > n_out_total:
+                vib_full[out_start:] += vib_seg[: n_out_total - out_start]
+            else:
+                vib_full[out_start:out_end] += vib_seg
+        b0 += num_blocks
+    return vib_full
+
+def _write_vibration(vib_full, out_wav):
     # Apply a single RMS-based normalization to the entire waveform
     # to ensure consistent loudness while preserving dynamics.
     target_rms = 0.15  # A conservative target to prevent excessive clipping
@@ -226,7 +308,8 @@ def process_file(in_wav, out_wav, overlap=0.0, content="game"):
     vib_full = np.clip(vib_full, -1.0, 1.0)
 
     # 5) write 8 kHz, 16-bit PCM
-    sf.write(out_wav, vib_full, VIB_SR, subtype="PCM_16")
+    sf.write(out_wav, vib_full, VIB_SR, subtype="PCM_16",
+             format="WAV" if hasattr(out_wav, "write") else None)
 
 # ---------------------------------------------------------------------------
 if __name__ == "__main__":
@@ -3,11 +3,13 @@
 % Optimized for long audio files (>1s) using time-varying analysis
 %
 % USAGE: 
-%   1. SET your input and output file paths in the "MAIN EXECUTION" section.
-%   2. RUN this script! It will automatically:
-%      a. Process the specified audio file.
-%      b. Generate a single vibration file at the specified output path.
-%      c. Convert the output from 44.1kHz/16-bit to 8kHz/16-bit format.
+%   Pitch(inputFilePath, outputFilePath)
+%      a. Processes the given audio file.
+%      b. Generates a single vibration file at the given output path.
+%      c. Converts the output from 44.1kHz/16-bit to 8kHz/16-bit format.
+%   Called with no arguments, it processes the example files set in the
+%   "MAIN EXECUTION" section. PitchWrapper.py calls it through the MATLAB
+%   Engine with the paths as arguments.
 %
 % Processing approach:
 % - Time-varying frequency analysis using paper's regression per bin
@@ -15,9 +17,12 @@
 % - Total loudness (envelope) -> Amplitude modulation
 
 %% MAIN EXECUTION
-% --- USER: Define your single input and output files here ---
-inputFilePath = '/Users/yinanli/Desktop/audio-to-haptic/sound2haptics_SP/1-85362-A-0.wav'; 
-outputFilePath = '/Users/yinanli/Desktop/audio-to-haptic/sound2haptics_SP/1-85362-A-0-pitch.wav'; 
+function Pitch(inputFilePath, outputFilePath)
+% --- USER: Define your single input and output files here (used when called without arguments) ---
+if nargin < 2
+    inputFilePath = '/Users/yinanli/Desktop/audio-to-haptic/sound2haptics_SP/1-85362-A-0.wav'; 
+    outputFilePath = '/Users/yinanli/Desktop/audio-to-haptic/sound2haptics_SP/1-85362-A-0-pitch.wav'; 
+end
 
 % --- Processing Logic ---
 fprintf('Starting single file processing...\n');
@@ -44,6 +49,7 @@ catch ME
     fprintf('\nAn unexpected error occurred during processing:\n');
     fprintf('%s\n', ME.message);
 end
+end
 
 
 %% Configuration Parameters
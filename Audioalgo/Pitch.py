@@ -3,11 +3,22 @@
 # (time-varying specific loudness -> vib freq; total loudness -> amplitude)
 # Requires: numpy, scipy, soundfile, mosqito
 
+import math
 from dataclasses import dataclass
 from pathlib import Path
 import numpy as np
 import soundfile as sf
-from scipy.signal import get_window, resample_poly
+from scipy.signal import resample_poly
+from numpy.lib.stride_tricks import sliding_window_view
+
+from dsp_utils import njit, lut_sin, NUMBA_AVAILABLE
+
+# Optional SIMD resampler (installed alongside librosa >= 0.10); resample_poly otherwise
+try:
+    import soxr
+    SOXR_AVAILABLE = True
+except Exception:
+    SOXR_AVAILABLE = False
 
 # --- ISO 532-1 loudness via MOSQITO (time-varying & specific loudness) ---
 # Docs: MoSQITo supports ISO 532-1 time-varying loudness and specific loudness (Bark). :contentReference[oaicite:1]{index=1}
@@ -19,6 +30,9 @@ try:
 except Exception:
     MOSQITO_AVAILABLE = False
 
+# (240, 24) matrix summing each contiguous group of ten 0.1-Bark bins into one Bark band
+BARK_240_TO_24 = np.repeat(np.eye(24), 10, axis=0)
+
 
 # ----------------------------- CONFIG --------------------------------------
 
@@ -63,6 +77,40 @@ def rms(x: np.ndarray) -> float:
     return float(np.sqrt(np.mean(np.square(x)) + 1e-12))
 
 
+# Serial on purpose: request threads call it concurrently, and numba's default
+# (workqueue) threading layer aborts on concurrent parallel=True calls
+@njit(cache=True, fastmath=True)
+def _windowed_bin_rms_jit(audio, starts, bin_size, win):
+    n = starts.size
+    out = np.empty(n, dtype=np.float64)
+    for i in range(n):
+        s = starts[i]
+        e = min(s + bin_size, audio.size)
+        acc = 0.0
+        for j in range(e - s):
+            v = audio[s + j] * win[j]
+            acc += v * v
+        out[i] = np.sqrt(acc / bin_size + 1e-12)
+    return out
+
+
+def windowed_bin_rms(audio: np.ndarray, starts: np.ndarray, bin_size: int, win: np.ndarray) -> np.ndarray:
+    """
+    rms() of every Hann-windowed, zero-padded bin audio[s:s+bin_size] for s in starts.
+    Uses the numba kernel when available, otherwise one strided matrix-vector product
+    (starts must be an evenly spaced arange, as built by analyze_audio_bins).
+    """
+    if NUMBA_AVAILABLE:
+        return _windowed_bin_rms_jit(audio.astype(np.float64), starts.astype(np.int64), bin_size, win.astype(np.float64))
+
+    sq = np.square(audio, dtype=np.float64)
+    if sq.size < bin_size:
+        sq = np.pad(sq, (0, bin_size - sq.size))
+    step = int(starts[1] - starts[0]) if starts.size > 1 else 1
+    frames = sliding_window_view(sq, bin_size)[::step][: starts.size]
+    return np.sqrt(frames @ np.square(win, dtype=np.float64) / bin_size + 1e-12)
+
+
 # -------------------- ISO 532-1 SPECIFIC & TOTAL LOUDNESS ------------------
 
 def _specific_and_total_loudness_bark(audio_bin: np.ndarray, sr: int):
@@ -98,12 +146,8 @@ def _specific_and_total_loudness_bark(audio_bin: np.ndarray, sr: int):
 
         # Aggregate 240 → 24 bands by summing each contiguous group of 10 bins.
         if N_spec.ndim == 2 and N_spec.shape[1] >= 240:
-            spec_time_mean = np.mean(N_spec, axis=0)  # [240]
-            spec24 = np.zeros(24, dtype=np.float32)
-            for i in range(24):
-                start = i * 10
-                end = start + 10
-                spec24[i] = float(np.sum(spec_time_mean[start:end]))
+            spec_time_mean = np.mean(N_spec[:, :240], axis=0)  # [240]
+            spec24 = (spec_time_mean @ BARK_240_TO_24).astype(np.float32)
         else:
             # Unexpected shape: fall back to interpolation to 24
             if N_spec.ndim == 1:  # [240] or other
@@ -125,23 +169,95 @@ def _specific_and_total_loudness_bark(audio_bin: np.ndarray, sr: int):
         return spec24, total
 
 
+def _loudness_track(audio: np.ndarray, sr: int):
+    """
+    Time-varying loudness of the whole signal from a single loudness_zwtv call.
+
+    Returns (t [T], N [T], spec24 [T, 24]), or None when MOSQITO is missing or
+    fails, in which case callers fall back to the per-bin estimate above.
+    """
+    if not MOSQITO_AVAILABLE:
+        return None
+    try:
+        results = loudness_zwtv(audio, sr, field_type="free")
+        N_time = np.asarray(results["N"], dtype=np.float64).reshape(-1)   # [T]
+        N_spec = np.asarray(results["N_specific"], dtype=np.float64)      # [T, 240]
+        t = np.asarray(results["time"], dtype=np.float64).reshape(-1) if "time" in results else None
+    except Exception:
+        return None
+
+    T = N_time.size
+    if T == 0 or N_spec.ndim != 2:
+        return None
+    if N_spec.shape[0] != T and N_spec.shape[1] == T:
+        N_spec = N_spec.T  # some MOSQITO versions return [240, T]
+    if N_spec.shape[0] != T or N_spec.shape[1] < 240:
+        return None
+
+    # Aggregate 240 → 24 bands by summing each contiguous group of 10 bins, as one GEMM.
+    spec24 = N_spec[:, :240] @ BARK_240_TO_24
+    spec24[~np.isfinite(spec24)] = 0.0
+
+    if t is None or t.size != T:
+        # MOSQITO's frames span the signal evenly; place them at their centres
+        t = (np.arange(T) + 0.5) * (len(audio) / float(sr)) / T
+    return t, N_time, spec24
+
+
+def _average_over_bins(t: np.ndarray, values: np.ndarray, t_start: np.ndarray, t_end: np.ndarray) -> np.ndarray:
+    """
+    Mean of values[T, ...] over each [t_start, t_end) window of the time axis t.
+    A window holding no frame takes the next frame (the last one past the end).
+    """
+    lo = np.searchsorted(t, t_start, side="left")
+    hi = np.searchsorted(t, t_end, side="left")
+    count = hi - lo
+    cs = np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)])
+    denom = np.maximum(count, 1).reshape((-1,) + (1,) * (values.ndim - 1))
+    out = (cs[hi] - cs[lo]) / denom
+    empty = count == 0
+    if np.any(empty):
+        out[empty] = values[np.minimum(lo[empty], len(t) - 1)]
+    return out
+
+
 # -------------------------- CORE MODEL COMPONENTS --------------------------
 
+def regression_vector(cfg: Config) -> np.ndarray:
+    """cfg.regressionCoeffs (1-based Bark band -> coeff) as a dense 24-band coefficient vector."""
+    coef = np.zeros(24, dtype=np.float64)
+    for bark_band, coeff in cfg.regressionCoeffs.items():
+        idx = int(bark_band) - 1  # MATLAB 1-based -> Python 0-based
+        if 0 <= idx < coef.size:
+            coef[idx] = coeff
+    return coef
+
+
 def predict_vibration_frequency(specific_loudness_24: np.ndarray, cfg: Config) -> float:
     """
     Linear regression over select Bark bands -> predicted vib frequency (Hz),
     then clamped to cfg.vibrationFreqRange.
     Mirrors MATLAB predictVibrationFrequency()
     """
-    predicted = 0.0
-    for bark_band, coeff in cfg.regressionCoeffs.items():
-        idx = int(bark_band) - 1  # MATLAB 1-based -> Python 0-based
-        if 0 <= idx < len(specific_loudness_24):
-            predicted += coeff * float(specific_loudness_24[idx]) * 1000.0
+    return float(predict_vibration_frequencies(np.asarray(specific_loudness_24)[None, :], cfg)[0])
 
-    predicted = abs(predicted)
+
+def predict_vibration_frequencies(spec24_all: np.ndarray, cfg: Config, silent: np.ndarray = None) -> np.ndarray:
+    """
+    predict_vibration_frequency() for every bin at once: spec24_all is [num_bins, 24].
+    Bins flagged in `silent` hold the previous bin's frequency (the range midpoint
+    before the first non-silent bin), as the per-bin loop did.
+    """
+    predicted = np.abs(spec24_all.astype(np.float64) @ regression_vector(cfg)) * 1000.0
     vmin, vmax = cfg.vibrationFreqRange
-    return float(np.clip(predicted, vmin, vmax))
+    np.clip(predicted, vmin, vmax, out=predicted)
+    if silent is None or not np.any(silent):
+        return predicted
+
+    # forward-fill silent bins from the last non-silent one
+    last = np.where(silent, -1, np.arange(predicted.size))
+    np.maximum.accumulate(last, out=last)
+    return np.where(last >= 0, predicted[np.maximum(last, 0)], np.mean(cfg.vibrationFreqRange))
 
 
 def analyze_audio_bins(audio: np.ndarray, sr: int, cfg: Config):
@@ -161,25 +277,39 @@ def analyze_audio_bins(audio: np.ndarray, sr: int, cfg: Config):
         starts = np.array([0], dtype=int)
 
     times = (starts + bin_size / 2.0) / float(sr)
-    freqs = np.zeros(starts.size, dtype=np.float32)
+    spec24_all = np.zeros((starts.size, 24), dtype=np.float32)
     amps = np.zeros(starts.size, dtype=np.float32)
-    win = get_window("hann", bin_size, fftbins=False).astype(np.float32)
-
-    for i, s in enumerate(starts):
-        e = min(s + bin_size, len(audio))
-        chunk = np.zeros(bin_size, dtype=np.float32)
-        seg = audio[s:e]
-        chunk[: len(seg)] = seg
-        chunk *= win
-
-        if rms(chunk) < 1e-3:
-            freqs[i] = freqs[i - 1] if i > 0 else np.mean(cfg.vibrationFreqRange)
-            amps[i] = 0.0
-            continue
+    # symmetric Hann, same as get_window("hann", bin_size, fftbins=False)
+    win = (0.5 * (1.0 - np.cos(2.0 * np.pi * np.arange(bin_size) / (bin_size - 1)))).astype(np.float32)
+
+    # One loudness_zwtv pass over the whole signal, averaged per bin; the
+    # per-bin call is only used when the batched track is unavailable.
+    track = _loudness_track(audio, sr)
+    if track is not None:
+        track_t, track_N, track_spec24 = track
+        t_start = starts / float(sr)
+        t_end = (starts + bin_size) / float(sr)
+        bin_spec24 = _average_over_bins(track_t, track_spec24, t_start, t_end).astype(np.float32)
+        bin_loud = _average_over_bins(track_t, track_N, t_start, t_end)
+
+    silent = windowed_bin_rms(audio, starts, bin_size, win) < 1e-3
+
+    if track is None:
+        chunk = np.empty(bin_size, dtype=np.float32)  # reused for every bin
+        for i in np.flatnonzero(~silent):
+            s = starts[i]
+            e = min(s + bin_size, len(audio))
+            seg = audio[s:e]
+            chunk[: seg.size] = seg
+            chunk[seg.size:] = 0.0
+            np.multiply(chunk, win, out=chunk)
+            spec24_all[i], loud = _specific_and_total_loudness_bark(chunk, sr)
+            amps[i] = float(loud)
+    else:
+        spec24_all = np.where(silent[:, None], 0.0, bin_spec24)
+        amps = np.where(silent, 0.0, bin_loud).astype(np.float32)
 
-        spec24, loud = _specific_and_total_loudness_bark(chunk, sr)
-        freqs[i] = predict_vibration_frequency(spec24, cfg)
-        amps[i] = float(loud)
+    freqs = predict_vibration_frequencies(spec24_all, cfg, silent).astype(np.float32)
 
     # smoothing on frequency
     if cfg.smoothingWindow > 1 and len(freqs) > cfg.smoothingWindow:
@@ -190,6 +320,29 @@ def analyze_audio_bins(audio: np.ndarray, sr: int, cfg: Config):
     return times.astype(np.float64), freqs.astype(np.float64), amps.astype(np.float64)
 
 
+@njit(cache=True, fastmath=True)
+def _synth_phase(f_inst, a_inst, dt, fade_len):
+    # Fused phase accumulation + sine + linear fade in/out: v[n] = w[n] a[n] sin(phi[n]),
+    # phi[n] = phi[n-1] + 2π f[n-1] dt, with phi wrapped into [0, 2π) so long files keep full precision
+    n = f_inst.size
+    v = np.empty_like(f_inst)
+    two_pi = 2.0 * math.pi
+    two_pi_dt = two_pi * dt
+    ramp = 1.0 / max(fade_len - 1, 1)  # same ramp as np.linspace(0, 1, fade_len)
+    phi = 0.0
+    for i in range(n):
+        w = 1.0
+        if i < fade_len:
+            w = i * ramp
+        elif i >= n - fade_len:
+            w = (n - 1 - i) * ramp
+        v[i] = w * a_inst[i] * lut_sin(phi)
+        phi += two_pi_dt * f_inst[i]
+        if phi >= two_pi:
+            phi -= two_pi * math.floor(phi / two_pi)
+    return v
+
+
 def generate_time_varying_vibration(audio: np.ndarray, sr: int, cfg: Config):
     bin_t, bin_f, bin_a = analyze_audio_bins(audio, sr, cfg)
 
@@ -216,20 +369,26 @@ def generate_time_varying_vibration(audio: np.ndarray, sr: int, cfg: Config):
 
     # Phase accumulation: phi[n] = phi[n-1] + 2π f[n-1] dt
     dt = 1.0 / float(sr)
-    phi = np.empty_like(t)
-    phi[0] = 0.0
-    # cumulative sum of frequency
-    phi[1:] = 2.0 * np.pi * np.cumsum(f_inst[:-1]) * dt
-
-    v = a_inst * np.sin(phi)
 
     # 10 ms fade in/out
     fade_len = int(round(0.01 * sr))
-    if len(v) > 2 * fade_len and fade_len > 0:
-        fade_in = np.linspace(0.0, 1.0, fade_len)
-        fade_out = np.linspace(1.0, 0.0, fade_len)
-        v[:fade_len] *= fade_in
-        v[-fade_len:] *= fade_out
+    if not (len(t) > 2 * fade_len and fade_len > 0):
+        fade_len = 0
+
+    if NUMBA_AVAILABLE:
+        v = _synth_phase(f_inst, a_inst, dt, fade_len)
+    else:
+        phi = np.empty_like(t)
+        phi[0] = 0.0
+        # cumulative sum of frequency
+        phi[1:] = 2.0 * np.pi * np.cumsum(f_inst[:-1]) * dt
+
+        v = a_inst * np.sin(phi)
+        if fade_len:
+            fade_in = np.linspace(0.0, 1.0, fade_len)
+            fade_out = np.linspace(1.0, 0.0, fade_len)
+            v[:fade_len] *= fade_in
+            v[-fade_len:] *= fade_out
 
     return v.astype(np.float32), f_inst.astype(np.float32), a_inst.astype(np.float32)
 
@@ -256,15 +415,37 @@ def _read_mono(path: str):
     return x, sr
 
 
+@njit(cache=True)
+def _scale_to_int16(y, scale):
+    out = np.empty(y.size, dtype=np.int16)
+    for i in range(y.size):
+        out[i] = np.int16(round(y[i] * scale))
+    return out
+
+
 def _write_int16_wav(path: str, y: np.ndarray, sr: int):
-    # peak normalize to [-1,1], then write 16-bit PCM
-    y = y / (np.max(np.abs(y)) + 1e-12)
-    sf.write(path, y, sr, subtype="PCM_16")
+    # peak normalize to [-1,1] and quantize to 16-bit in one pass, then write the PCM as is
+    scale = 32767.0 / (np.max(np.abs(y)) + 1e-12)
+    if NUMBA_AVAILABLE:
+        pcm = _scale_to_int16(np.ascontiguousarray(y), scale)
+    else:
+        pcm = np.rint(y * scale).astype(np.int16)
+    sf.write(path, pcm, sr, subtype="PCM_16", format="WAV" if hasattr(path, "write") else None)
 
 
 def process_audio_file(input_file: str, output_file: str, cfg: Config):
     print(f"Processing: {input_file}")
     audio, sr = _read_mono(input_file)
+    ok, result = process_audio_array(audio, sr, output_file, cfg)
+    result["inputFile"] = str(input_file)
+    return ok, result
+
+
+def process_audio_array(audio: np.ndarray, sr: int, output_file: str, cfg: Config):
+    # Already decoded samples, shape (frames,) or (frames, channels); the array is not modified
+    if audio.ndim == 2:
+        audio = audio.mean(axis=1, dtype=np.float32)
+    audio = audio.astype(np.float32, copy=False)
     duration = len(audio) / float(sr)
 
     audio = normalize_audio(audio, True)
@@ -274,20 +455,23 @@ def process_audio_file(input_file: str, output_file: str, cfg: Config):
     # Resample to target (8 kHz) like MATLAB
     fs_out = cfg.outputSampleRate
     if sr != fs_out:
-        # rational resample
-        from fractions import Fraction
-        frac = Fraction(fs_out, sr).limit_denominator(1000)
-        v = resample_poly(v, frac.numerator, frac.denominator)
+        if SOXR_AVAILABLE:
+            v = soxr.resample(v, sr, fs_out, quality="HQ")
+        else:
+            # rational resample
+            from fractions import Fraction
+            frac = Fraction(fs_out, sr).limit_denominator(1000)
+            v = resample_poly(v, frac.numerator, frac.denominator)
 
-    out_dir = Path(output_file).parent
-    if str(out_dir) and not out_dir.exists():
-        out_dir.mkdir(parents=True, exist_ok=True)
-        print(f"Created output directory: {out_dir}")
+    if not hasattr(output_file, "write"):  # file-like outputs are written as they are
+        out_dir = Path(output_file).parent
+        if str(out_dir) and not out_dir.exists():
+            out_dir.mkdir(parents=True, exist_ok=True)
+            print(f"Created output directory: {out_dir}")
 
     _write_int16_wav(output_file, v, fs_out)
 
     result = {
-        "inputFile": str(input_file),
         "outputFile": str(output_file),
         "duration": duration,
         "originalSr": sr,
@@ -1,188 +1,236 @@
 #!/usr/bin/env python3
 """
-Python wrapper for MATLAB Pitch.m algorithm using MATLAB Engine for Python
+Python wrapper for the Pitch algorithm
 Sound-to-Touch Crossmodal Pitch Matching based on IEEE Transactions on Haptics 2024
 
-This wrapper calls the MATLAB Pitch.m file directly using the MATLAB Engine.
+PitchProcessor runs the in-process Python port (Pitch.py) by default. The
+original MATLAB Pitch.m can still be used through the MATLAB Engine by setting
+PITCH_USE_MATLAB=1 (or passing use_matlab=True); matlab.engine is only imported
+in that case.
 """
 
+import io
 import os
 import sys
+import atexit
+import queue
 import tempfile
-import shutil
+import threading
 from pathlib import Path
-import soundfile as sf
-import numpy as np
-
-# Try to import MATLAB Engine
-try:
-    import matlab.engine
-    MATLAB_ENGINE_AVAILABLE = True
-    print("✅ MATLAB Engine for Python is available")
-except ImportError as e:
-    MATLAB_ENGINE_AVAILABLE = False
-    print(f"❌ MATLAB Engine for Python not available: {e}")
+
+import Pitch as pitch_py
+
+USE_MATLAB = os.environ.get("PITCH_USE_MATLAB", "").strip().lower() in ("1", "true", "yes")
+
+# MATLAB engines take 10-20 s to start, so they are started lazily, kept for
+# the life of the process and shared between requests. Engine calls are not
+# reentrant: each request checks one out of the pool and returns it after.
+MATLAB_DIR = Path(__file__).parent
+MATLAB_SHIMS_DIR = MATLAB_DIR / "matlab_shims"
+# Toolbox functions Pitch.m uses that have a stand-in under matlab_shims/<name>/
+MATLAB_SHIMMED_FUNCTIONS = ("hann", "resample", "acousticLoudness")
+MAX_MATLAB_ENGINES = max(1, int(os.environ.get("PITCH_MATLAB_ENGINES", "2")))
+# Pitch.m needs no desktop, splash screen or Java; skipping them shortens engine startup
+MATLAB_STARTUP_OPTIONS = os.environ.get("PITCH_MATLAB_OPTIONS", "-nodesktop -nosplash -nojvm")
+
+_engine_pool = queue.Queue()
+_engine_lock = threading.Lock()
+_engines = []  # every engine started, for shutdown
+_matlab_engine = None  # matlab.engine module once imported
+
+
+def _import_matlab_engine():
+    """Import matlab.engine on first use; raises RuntimeError if it is not installed"""
+    global _matlab_engine
+    if _matlab_engine is None:
+        try:
+            import matlab.engine
+        except ImportError as e:
+            raise RuntimeError(f"MATLAB Engine for Python is not available: {e}")
+        _matlab_engine = matlab.engine
+        print("✅ MATLAB Engine for Python is available")
+    return _matlab_engine
+
+
+def _acquire_engine():
+    """Take an idle engine, start a new one if the pool is not full, or wait for one"""
+    try:
+        return _engine_pool.get_nowait()
+    except queue.Empty:
+        pass
+
+    with _engine_lock:
+        if len(_engines) < MAX_MATLAB_ENGINES:
+            matlab_engine = _import_matlab_engine()
+            engine = None
+            try:
+                engine = matlab_engine.start_matlab(MATLAB_STARTUP_OPTIONS)
+                # Pitch.m is a function on the path; a shim is only added when the
+                # toolbox function it stands in for is missing, so installed
+                # (compiled) toolbox versions are never shadowed
+                shims = [str(MATLAB_SHIMS_DIR / name) for name in MATLAB_SHIMMED_FUNCTIONS
+                         if engine.exist(name, nargout=1) == 0]
+                engine.addpath(*shims, str(MATLAB_DIR), nargout=0)
+            except Exception as e:
+                # e.g. matlab.engine.EngineError on licence or startup problems;
+                # RuntimeError is what callers treat as "Pitch unavailable"
+                print(f"❌ Failed to start MATLAB Engine: {e}")
+                if engine is not None:
+                    try:
+                        engine.quit()
+                    except Exception:
+                        pass
+                raise RuntimeError(f"Failed to start MATLAB Engine: {e}") from e
+            if shims:
+                print(f"   Using MATLAB stand-ins for: {', '.join(Path(p).name for p in shims)}")
+            _engines.append(engine)
+            print(f"✅ MATLAB Engine started successfully ({len(_engines)}/{MAX_MATLAB_ENGINES})")
+            return engine
+
+    return _engine_pool.get()
+
+
+def _release_engine(engine):
+    _engine_pool.put(engine)
+
+
+def _reset_engines():
+    """
+    Forget engines inherited from a parent process (e.g. in a forked pool
+    worker) without quitting them; they belong to the parent, and this
+    process starts its own on demand.
+    """
+    global _engine_pool, _engine_lock, _engines
+    _engine_pool = queue.Queue()
+    _engine_lock = threading.Lock()
+    _engines = []
+
+
+@atexit.register
+def _shutdown_engines():
+    """Quit every MATLAB engine this process started"""
+    while _engines:
+        engine = _engines.pop()
+        try:
+            engine.quit()
+        except Exception:
+            pass
+
 
 class PitchProcessor:
     """
-    Wrapper class for the MATLAB Pitch.m algorithm using MATLAB Engine
+    Façade over the Pitch algorithm: the Python port by default, MATLAB Pitch.m on request
     """
     
-    def __init__(self):
-        self.matlab_script_path = Path(__file__).parent / "Pitch.m"
-        self.engine = None
+    def __init__(self, use_matlab=None):
+        self.use_matlab = USE_MATLAB if use_matlab is None else use_matlab
+        self.matlab_script_path = MATLAB_DIR / "Pitch.m"
+        self.config = pitch_py.get_config()
         
-        if MATLAB_ENGINE_AVAILABLE:
-            self._start_matlab_engine()
-        else:
-            raise RuntimeError("MATLAB Engine for Python is not available")
-    
-    def _start_matlab_engine(self):
-        """Start MATLAB Engine for Python"""
-        try:
-            self.engine = matlab.engine.start_matlab()
-            print("✅ MATLAB Engine started successfully")
-        except Exception as e:
-            print(f"❌ Failed to start MATLAB Engine: {e}")
-            self.engine = None
-            raise
+        if self.use_matlab:
+            _import_matlab_engine()
+            # Pay the engine startup when the processor is built (at backend
+            # import) rather than on the first request
+            _release_engine(_acquire_engine())
     
     def process_file(self, input_wav, output_wav, **kwargs):
         """
-        Process audio file using MATLAB Pitch.m algorithm
+        Process audio file using the Pitch algorithm
         
         Args:
-            input_wav: Path to input audio file
+            input_wav: Path to input audio file (or a binary file-like object)
             output_wav: Path to output vibration file
             **kwargs: Additional parameters (unused for now)
             
         Returns:
             bool: True if successful, False otherwise
         """
-        if not self.engine:
-            print("❌ MATLAB Engine not available")
-            return False
-        
-        if not self.matlab_script_path.exists():
-            print(f"❌ MATLAB script not found: {self.matlab_script_path}")
-            return False
+        if self.use_matlab:
+            return self._process_file_matlab(input_wav, output_wav)
         
         try:
-            # Create temporary directory for processing
-            with tempfile.TemporaryDirectory() as temp_dir:
-                temp_path = Path(temp_dir)
-                
-                # Copy input file to temp directory
-                temp_input = temp_path / "input.wav"
-                temp_output = temp_path / "output.wav"
-                
-                shutil.copy2(input_wav, temp_input)
-                
-                # Create a modified MATLAB script that uses our temp files
-                modified_script = self._create_modified_matlab_script(temp_input, temp_output)
-                script_path = temp_path / "run_pitch.m"
-                
-                with open(script_path, 'w') as f:
-                    f.write(modified_script)
-                
-                # Run MATLAB script using the engine
-                print(f"🔄 Running MATLAB Pitch algorithm...")
-                
-                # Change to temp directory and run the script
-                self.engine.cd(str(temp_path))
-                self.engine.run(str(script_path), nargout=0)
-                
-                # Check if output file was created
-                if temp_output.exists():
-                    # Copy output to final destination
-                    shutil.copy2(temp_output, output_wav)
-                    print(f"✅ Pitch algorithm completed successfully")
-                    return True
-                else:
-                    print("❌ MATLAB script did not produce output file")
-                    return False
-                    
+            # file-like inputs/outputs (e.g. in-memory buffers) go to soundfile as they are
+            source = input_wav if hasattr(input_wav, "read") else str(input_wav)
+            target = output_wav if hasattr(output_wav, "write") else str(output_wav)
+            success, _ = pitch_py.process_audio_file(source, target, self.config)
+            return success
         except Exception as e:
-            print(f"❌ Error processing with MATLAB Engine: {e}")
+            print(f"❌ Error in Python Pitch algorithm: {e}")
             return False
     
-    def _create_modified_matlab_script(self, input_file, output_file):
+    def process_array(self, samples, sample_rate, output_wav):
         """
-        Create a modified version of the MATLAB script that uses our temp files
-        """
-        # Read the original Pitch.m file
-        with open(self.matlab_script_path, 'r') as f:
-            original_script = f.read()
+        Process already decoded samples (float32, shape (frames,) or
+        (frames, channels)) without reading a file; MATLAB still gets a WAV.
         
-        # Replace the hardcoded file paths with our temp files
-        modified_script = original_script.replace(
-            "inputFilePath = '/Users/yinanli/Desktop/audio-to-haptic/sound2haptics_SP/1-85362-A-0.wav';",
-            f"inputFilePath = '{input_file}';"
-        ).replace(
-            "outputFilePath = '/Users/yinanli/Desktop/audio-to-haptic/sound2haptics_SP/1-85362-A-0-pitch.wav';",
-            f"outputFilePath = '{output_file}';"
-        )
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        if self.use_matlab:
+            import soundfile as sf
+            input_wav = io.BytesIO()
+            sf.write(input_wav, samples, sample_rate, format="WAV", subtype="FLOAT")
+            input_wav.seek(0)
+            return self._process_file_matlab(input_wav, output_wav)
         
-        # Replace missing functions with custom implementations
-        function_replacements = """
-% Custom Hann window function (replacement for Signal Processing Toolbox)
-function w = hann(n)
-    if n == 1
-        w = 1;
-    else
-        w = 0.5 * (1 - cos(2*pi*(0:n-1)'/(n-1)));
-    end
-end
-
-% Custom acoustic loudness function (simplified replacement for Audio Toolbox)
-function [loudness, specificLoudnessMatrix] = acousticLoudness(audio, sr, varargin)
-    % Simplified loudness calculation using RMS
-    loudness = rms(audio);
-    
-    % Create a simple specific loudness matrix (24 Bark bands)
-    % This is a simplified approximation
-    nBands = 24;
-    specificLoudnessMatrix = zeros(1, nBands);
-    
-    % Distribute loudness across frequency bands (simplified)
-    for i = 1:nBands
-        specificLoudnessMatrix(i) = loudness / nBands;
-    end
-end
-
-% Custom resample function (simplified replacement for Signal Processing Toolbox)
-function y = resample(x, p, q)
-    % Simple resampling using interpolation
-    % This is a basic implementation
-    if p == q
-        y = x;
-        return;
-    end
-    
-    % Calculate new length
-    newLength = round(length(x) * p / q);
-    
-    % Create new time vector
-    oldTime = 1:length(x);
-    newTime = linspace(1, length(x), newLength);
+        try:
+            target = output_wav if hasattr(output_wav, "write") else str(output_wav)
+            success, _ = pitch_py.process_audio_array(samples, sample_rate, target, self.config)
+            return success
+        except Exception as e:
+            print(f"❌ Error in Python Pitch algorithm: {e}")
+            return False
     
-    % Interpolate
-    y = interp1(oldTime, x, newTime, 'linear', 'extrap');
-end
-"""
+    def _process_file_matlab(self, input_wav, output_wav):
+        # MATLAB only takes file paths; in-memory buffers go through a scratch directory
+        if hasattr(input_wav, "read") or hasattr(output_wav, "write"):
+            with tempfile.TemporaryDirectory() as temp_dir:
+                input_path, output_path = input_wav, output_wav
+                if hasattr(input_wav, "read"):
+                    input_path = Path(temp_dir) / "input_audio.wav"
+                    input_path.write_bytes(input_wav.read())
+                if hasattr(output_wav, "write"):
+                    output_path = Path(temp_dir) / "pitch_output.wav"
+                success = self._process_file_matlab(input_path, output_path)
+                if success and hasattr(output_wav, "write"):
+                    output_wav.write(output_path.read_bytes())
+                return success
         
-        # Add the custom functions at the beginning of the script
-        modified_script = function_replacements + "\n" + modified_script
+        if not self.matlab_script_path.exists():
+            print(f"❌ MATLAB script not found: {self.matlab_script_path}")
+            return False
         
-        return modified_script
-    
-    def __del__(self):
-        """Clean up MATLAB engine when object is destroyed"""
-        if self.engine:
-            try:
-                self.engine.quit()
-            except:
-                pass
+        try:
+            engine = _acquire_engine()
+        except Exception:
+            print("❌ MATLAB Engine not available")
+            return False
+        
+        try:
+            # MATLAB reads and writes the caller's files directly; absolute
+            # paths, since the engine's working directory is its own
+            input_path = Path(input_wav).resolve()
+            output_path = Path(output_wav).resolve()
+            
+            print(f"🔄 Running MATLAB Pitch algorithm...")
+            engine.Pitch(str(input_path), str(output_path), nargout=0)
+            
+            # Check if output file was created
+            if output_path.exists():
+                print(f"✅ Pitch algorithm completed successfully")
+                return True
+            else:
+                print("❌ MATLAB script did not produce output file")
+                return False
+                
+        except Exception as e:
+            print(f"❌ Error processing with MATLAB Engine: {e}")
+            return False
+        finally:
+            _release_engine(engine)
+
+
+_processor = None
 
 def process_file(in_wav, out_wav, **kwargs):
     """
@@ -196,9 +244,11 @@ def process_file(in_wav, out_wav, **kwargs):
     Returns:
         bool: True if successful, False otherwise
     """
+    global _processor
     try:
-        processor = PitchProcessor()
-        return processor.process_file(in_wav, out_wav, **kwargs)
+        if _processor is None:
+            _processor = PitchProcessor()
+        return _processor.process_file(in_wav, out_wav, **kwargs)
     except Exception as e:
         print(f"❌ Failed to create PitchProcessor: {e}")
         return False
@@ -207,7 +257,7 @@ if __name__ == "__main__":
     # Test the wrapper
     import argparse
     
-    parser = argparse.ArgumentParser(description="MATLAB Pitch Algorithm Wrapper")
+    parser = argparse.ArgumentParser(description="Pitch Algorithm Wrapper")
     parser.add_argument("--input_file", required=True, help="Input audio file")
     parser.add_argument("--output_file", required=True, help="Output vibration file")
     
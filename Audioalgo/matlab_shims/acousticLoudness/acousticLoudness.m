@@ -0,0 +1,11 @@
+function [loudness, specificLoudnessMatrix] = acousticLoudness(audio, sr, varargin)
+% Custom acoustic loudness function (simplified replacement for Audio Toolbox)
+    % Simplified loudness calculation using RMS (written out, so no
+    % toolbox lookup for rms() on every call)
+    loudness = sqrt(mean(audio.^2));
+    
+    % Create a simple specific loudness matrix (24 Bark bands)
+    % This is a simplified approximation: loudness spread evenly over the bands
+    nBands = 24;
+    specificLoudnessMatrix = repmat(loudness / nBands, 1, nBands);
+end
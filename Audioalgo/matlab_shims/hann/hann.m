@@ -0,0 +1,8 @@
+function w = hann(n)
+% Custom Hann window function (replacement for Signal Processing Toolbox)
+    if n == 1
+        w = 1;
+    else
+        w = 0.5 * (1 - cos(2*pi*(0:n-1)'/(n-1)));
+    end
+end
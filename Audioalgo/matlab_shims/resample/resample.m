@@ -0,0 +1,49 @@
+function y = resample(x, p, q)
+% Custom resample function (replacement for Signal Processing Toolbox)
+    % Polyphase FIR resampling with a Hann-windowed sinc, same semantics as
+    % upfirdn(x, h, p, q): only the taps that land on real (non-inserted)
+    % samples are evaluated, and outputs are computed a block at a time with
+    % vectorized indexing instead of interpolating sample by sample.
+    g = gcd(p, q);
+    p = p / g;
+    q = q / g;
+    if p == q
+        y = x;
+        return;
+    end
+
+    isRow = size(x, 1) == 1;
+    x = x(:);
+    n = length(x);
+
+    % Lowpass at the tighter of the two Nyquist limits, 10 zero crossings per side
+    pq = max(p, q);
+    half = 10 * pq;
+    k = (-half:half)';
+    fc = 1 / pq;
+    h = fc * ones(size(k));
+    nz = k ~= 0;
+    h(nz) = sin(pi * fc * k(nz)) ./ (pi * k(nz));
+    h = p * h .* (0.5 * (1 + cos(pi * k / (half + 1))));
+
+    % y(m) = sum_i x(i) * h(m*q - i*p) over |m*q - i*p| <= half
+    outLength = ceil(n * p / q);
+    taps = floor(2 * half / p) + 1;
+    y = zeros(outLength, 1);
+    blockSize = 8192;
+    for first = 0:blockSize:outLength-1
+        m = (first:min(first + blockSize, outLength) - 1)';
+        idx = ceil((m * q - half) / p) + (0:taps-1);
+        offs = m * q - idx * p;
+        valid = idx >= 0 & idx < n & abs(offs) <= half;
+        idx(~valid) = 0;
+        offs(~valid) = 0;
+        w = h(offs + half + 1);
+        w(~valid) = 0;
+        y(m + 1) = sum(reshape(x(idx + 1), size(w)) .* w, 2);
+    end
+
+    if isRow
+        y = y.';
+    end
+end
@@ -5,11 +5,14 @@
 
 import os
 import sys
+import math
 import torch
 import torchaudio
 import torchaudio.functional as F
 import numpy as np
+import soundfile as sf
 from pathlib import Path
+from scipy.signal import sosfilt
 
 # --- Add EnCodec clone to Python path ---
 current_dir = Path(__file__).parent
@@ -30,6 +33,46 @@ except ImportError:
         from model import EncodecModel
         from modules.seanet import SEANetDecoder
 
+POSTPROCESS_SAMPLE_RATE = 24000  # the model outputs at 24kHz
+
+# SEANet hyperparameters of EnCodec's 24kHz model (SEANetEncoder/Decoder defaults),
+# so the custom decoder is built without introspecting the default one
+DECODER_DIMENSION = 128
+DECODER_N_FILTERS = 32
+DECODER_N_RESIDUAL_LAYERS = 1
+DECODER_RATIOS = [8, 5, 4, 2]
+
+# On CPU the decoder can run as a frozen TorchScript trace; opt-in
+# (MODEL_JIT_TRACE=1), and only kept if it matches the eager decoder
+JIT_TRACE_CPU = os.environ.get('MODEL_JIT_TRACE', '0') == '1'
+# On CUDA (compute capability >= 7.0) the encoder/decoder can be compiled with
+# torch.compile; opt-in (MODEL_TORCH_COMPILE=1) as the first calls pay for compilation
+TORCH_COMPILE_CUDA = os.environ.get('MODEL_TORCH_COMPILE', '0') == '1'
+
+
+def _rbj_biquad_sos(kind, sample_rate, cutoff_freq, Q=0.707):
+    """One normalised SOS row [b0, b1, b2, 1, a1, a2] with the same RBJ
+    coefficients torchaudio's highpass_biquad / lowpass_biquad use."""
+    w0 = 2 * math.pi * cutoff_freq / sample_rate
+    alpha = math.sin(w0) / 2 / Q
+    cos_w0 = math.cos(w0)
+    if kind == 'highpass':
+        b = [(1 + cos_w0) / 2, -1 - cos_w0, (1 + cos_w0) / 2]
+    else:
+        b = [(1 - cos_w0) / 2, 1 - cos_w0, (1 - cos_w0) / 2]
+    a = [1 + alpha, -2 * cos_w0, 1 - alpha]
+    return [c / a[0] for c in b + a]
+
+
+def postprocess_sos(sample_rate=POSTPROCESS_SAMPLE_RATE):
+    """DC blocker (10 Hz HP) + 20-400 Hz band limit as a single (3, 6) SOS cascade"""
+    return np.array([
+        _rbj_biquad_sos('highpass', sample_rate, 10),
+        _rbj_biquad_sos('highpass', sample_rate, 20),
+        _rbj_biquad_sos('lowpass', sample_rate, 400),
+    ])
+
+
 class Model2Inference:
     def __init__(self, model_path, device='auto'):
         if device == 'auto':
@@ -38,24 +81,27 @@ class Model2Inference:
             self.device = torch.device(device)
         print(f"Using device: {self.device}")
         
-        self.model = EncodecModel.encodec_model_24khz().to(self.device)
+        # Every weight comes from the checkpoint below, so the pretrained
+        # EnCodec download/load is skipped and the model is only moved to the
+        # device once its (replaced) decoder is in place
+        self.model = EncodecModel.encodec_model_24khz(pretrained=False)
         self.model.set_target_bandwidth(6.0)
 
         ### MODIFIED ARCHITECTURE ###
         # Ensure decoder architecture matches the training script EXACTLY
-        old_decoder = self.model.decoder
         self.model.decoder = SEANetDecoder(
             channels=1, 
-            dimension=old_decoder.dimension, 
-            n_filters=old_decoder.n_filters,
-            n_residual_layers=old_decoder.n_residual_layers, 
-            ratios=old_decoder.ratios,
+            dimension=DECODER_DIMENSION, 
+            n_filters=DECODER_N_FILTERS,
+            n_residual_layers=DECODER_N_RESIDUAL_LAYERS, 
+            ratios=DECODER_RATIOS,
             activation='LeakyReLU', 
             activation_params={'negative_slope': 0.2},
             final_activation=None, 
             norm='weight_norm', 
             lstm=2
-        ).to(self.device)
+        )
+        self.model.to(self.device)
         ### END MODIFICATION ###
         
         print(f"Loading model from: {model_path}")
@@ -73,11 +119,32 @@ class Model2Inference:
         
         self.model.load_state_dict(fixed_state_dict)
         self.model.eval()
+        # Drop the checkpoint copy of the weights and hand its cached blocks back
+        del checkpoint, state_dict, fixed_state_dict
+        if self.device.type == 'cuda':
+            torch.cuda.empty_cache()
+        
+        self._encoder = self.model.encoder
+        self._decoder = self.model.decoder
+        if self.device.type == 'cpu' and JIT_TRACE_CPU:
+            self._decoder = self._trace_decoder()
+        elif self.device.type == 'cuda' and TORCH_COMPILE_CUDA:
+            self._compile_cuda()
         
         self.audio_resampler = torchaudio.transforms.Resample(
             orig_freq=44100, new_freq=24000
         ).to(self.device)
         
+        self._postprocess_sos = postprocess_sos()
+        # The same sections as 0-d device tensors, so F.biquad does not build them per call
+        self._postprocess_biquads = [
+            tuple(torch.tensor(c, dtype=torch.float32, device=self.device) for c in section)
+            for section in self._postprocess_sos
+        ]
+        # Output resamplers by target rate; the Kaiser kernel is built once per rate
+        self._resamplers = {}
+        self._output_resampler(8000)
+        
         print("Model loaded and ready for inference!")
     
     def _fix_state_dict_keys(self, state_dict):
@@ -101,8 +168,27 @@ class Model2Inference:
         
         return new_state_dict
     
-    def preprocess_audio(self, audio_path, max_duration=10.0):
-        # Optimized preprocessing with duration limiting for faster inference
+    def _load_mono(self, audio_path, max_duration):
+        """Read at most max_duration seconds as a mono [1, T] float32 tensor.
+
+        soundfile decodes only the frames that are kept and the downmix
+        happens in numpy before the tensor is made; formats libsndfile
+        cannot read (e.g. .m4a) fall back to torchaudio.load.
+        """
+        try:
+            with sf.SoundFile(audio_path) as f:
+                sr = f.samplerate
+                max_samples = int(max_duration * sr)
+                # Limit audio duration to prevent long processing times
+                if f.frames > max_samples:
+                    print(f"   Truncated audio to {max_duration}s for faster processing")
+                data = f.read(min(f.frames, max_samples), dtype='float32', always_2d=True)
+            mono = data.mean(axis=1, dtype=np.float32) if data.shape[1] > 1 else data[:, 0]
+            return torch.from_numpy(np.ascontiguousarray(mono)).unsqueeze(0), sr
+        except Exception:
+            if hasattr(audio_path, 'seek'):
+                audio_path.seek(0)  # in-memory input: rewind after soundfile's attempt
+        
         audio, sr = torchaudio.load(audio_path)
         if audio.shape[0] > 1:
             audio = audio.mean(dim=0, keepdim=True)
@@ -112,7 +198,24 @@ class Model2Inference:
         if audio.shape[1] > max_samples:
             audio = audio[:, :max_samples]
             print(f"   Truncated audio to {max_duration}s for faster processing")
-        
+        return audio, sr
+    
+    def preprocess_audio(self, audio_path, max_duration=10.0):
+        # Optimized preprocessing with duration limiting for faster inference
+        audio, sr = self._load_mono(audio_path, max_duration)
+        return self._prepare_input(audio, sr)
+    
+    def preprocess_array(self, samples, sample_rate, max_duration=10.0):
+        """preprocess_audio() on already decoded float32 samples, shape (frames,) or (frames, channels)"""
+        max_samples = int(max_duration * sample_rate)
+        if len(samples) > max_samples:
+            samples = samples[:max_samples]
+            print(f"   Truncated audio to {max_duration}s for faster processing")
+        # copied, since the caller's array may be shared (and read-only)
+        mono = samples.mean(axis=1, dtype=np.float32) if samples.ndim > 1 else np.array(samples, dtype=np.float32)
+        return self._prepare_input(torch.from_numpy(mono).unsqueeze(0), sample_rate)
+    
+    def _prepare_input(self, audio, sr):
         audio = audio.to(self.device)
         if sr != 24000:
             audio = self.audio_resampler(audio)
@@ -123,41 +226,120 @@ class Model2Inference:
         
         return audio.unsqueeze(0)
     
+    def _trace_decoder(self):
+        """Frozen TorchScript trace of the decoder for CPU inference.
+
+        Freezing folds the weight-norm reparametrisation into constants and
+        lets oneDNN fuse the conv stacks, and the LSTM/conv-transpose chain
+        no longer goes through Python dispatch per layer.
+
+        SConv1d computes its extra padding from the input length, which a
+        trace records as a constant for the example's length; the trace is
+        therefore checked against the eager decoder on a different (10 s)
+        length and discarded if the outputs differ. Falls back to the eager
+        decoder if tracing or the check fails.
+        """
+        example = torch.zeros(1, DECODER_DIMENSION, self.model.frame_rate, device=self.device)  # 1 s of latents
+        check = torch.randn(1, DECODER_DIMENSION, 10 * self.model.frame_rate + 3, device=self.device)
+        try:
+            with torch.no_grad():
+                traced = torch.jit.trace(self.model.decoder, example)
+                traced = torch.jit.freeze(traced.eval())
+                expected = self.model.decoder(check)
+                actual = traced(check)
+            if actual.shape != expected.shape or not torch.allclose(actual, expected, rtol=1e-4, atol=1e-5):
+                print("   Traced decoder does not match the eager decoder on other lengths, using eager decoder")
+                return self.model.decoder
+            print("   Decoder traced with TorchScript for CPU inference")
+            return traced
+        except Exception as e:
+            print(f"   Decoder tracing failed, using eager decoder: {e}")
+            return self.model.decoder
+    
+    def _compile_cuda(self):
+        """torch.compile the encoder and decoder for Tensor Core GPUs.
+
+        dynamic=True keeps one graph for every input length instead of
+        recompiling per clip duration; the quantizer stays eager.
+        """
+        if not hasattr(torch, 'compile') or torch.cuda.get_device_capability(self.device)[0] < 7:
+            print("   torch.compile skipped (needs PyTorch 2 and compute capability >= 7.0)")
+            return
+        try:
+            self._encoder = torch.compile(self.model.encoder, dynamic=True)
+            self._decoder = torch.compile(self.model.decoder, dynamic=True)
+            print("   Encoder/decoder compiled with torch.compile")
+        except Exception as e:
+            print(f"   torch.compile failed, using eager modules: {e}")
+            self._encoder = self.model.encoder
+            self._decoder = self.model.decoder
+    
     def generate_vibration(self, audio_tensor):
-        with torch.no_grad():
+        # inference_mode also skips the view/version tracking no_grad keeps;
+        # on CUDA the conv stacks run in FP16 autocast (Tensor Cores)
+        use_amp = self.device.type == 'cuda'
+        with torch.inference_mode():
             # Enable optimizations for faster inference
             torch.backends.cudnn.benchmark = True if self.device.type == 'cuda' else False
             
-            z = self.model.encoder(audio_tensor)
-            quantized_result = self.model.quantizer(z, frame_rate=self.model.frame_rate)
+            with torch.autocast(device_type=self.device.type, dtype=torch.float16, enabled=use_amp):
+                z = self._encoder(audio_tensor)
+            # Codebook lookups stay in FP32
+            quantized_result = self.model.quantizer(z.float(), frame_rate=self.model.frame_rate)
             zq = quantized_result.quantized
-            vib_pred = self.model.decoder(zq)
-        return vib_pred
+            with torch.autocast(device_type=self.device.type, dtype=torch.float16, enabled=use_amp):
+                vib_pred = self._decoder(zq)
+        return vib_pred.float()
     
+    def _output_resampler(self, output_sample_rate):
+        """Cached 24 kHz -> output_sample_rate Resample on the model's device"""
+        resampler = self._resamplers.get(output_sample_rate)
+        if resampler is None:
+            resampler = torchaudio.transforms.Resample(
+                orig_freq=POSTPROCESS_SAMPLE_RATE, new_freq=output_sample_rate
+            ).to(self.device)
+            self._resamplers[output_sample_rate] = resampler
+        return resampler
+
+    def _apply_postprocess_filters(self, vib):
+        """Run the postprocess SOS cascade where the tensor lives.
+
+        CUDA tensors stay on the GPU and go through torchaudio's biquad once
+        per section; CPU tensors go through scipy's sosfilt one section at a
+        time. Either way the signal is clamped to [-1, 1] after every section,
+        as torchaudio's biquad does: the decoder output is unbounded, so a
+        single clamp at the end would give a different result.
+        """
+        if vib.is_cuda:
+            for b0, b1, b2, a0, a1, a2 in self._postprocess_biquads:
+                vib = F.biquad(vib, b0, b1, b2, a0, a1, a2)
+            return vib
+        vib_np = vib.numpy()
+        for section in self._postprocess_sos:
+            vib_np = sosfilt(section[np.newaxis], vib_np, axis=-1)
+            np.clip(vib_np, -1.0, 1.0, out=vib_np)
+        return torch.from_numpy(vib_np.astype(np.float32))
+
     ### MODIFIED POST-PROCESSING ###
     def postprocess_vibration(self, vib_tensor, output_sample_rate=8000):
         """
         Post-processes the raw model output with a proper audio effects chain.
         """
         print(f"Postprocessing vibration...")
-        sample_rate = 24000
-        vib = vib_tensor.squeeze(0).cpu()
+        sample_rate = POSTPROCESS_SAMPLE_RATE
+        vib = vib_tensor.squeeze(0)  # left on the model's device
 
-        vib = F.highpass_biquad(vib, sample_rate, cutoff_freq=10)
+        # DC block (10 Hz HP) + 20-400 Hz band limit as one 3-section SOS cascade,
+        # clamped after each section like torchaudio's biquad
+        vib = self._apply_postprocess_filters(vib)
         print("   Applied DC blocking filter.")
-
-        vib = F.highpass_biquad(vib, sample_rate, cutoff_freq=20, Q=0.707) # Low-cut
-        vib = F.lowpass_biquad(vib, sample_rate, cutoff_freq=400, Q=0.707)  # High-cut
         print("   Applied band-limiting filter (20-400 Hz).")
 
         vib = torch.tanh(vib)
         print("   Applied soft limiter (tanh).")
 
         if output_sample_rate != sample_rate:
-            resampler = torchaudio.transforms.Resample(
-                orig_freq=sample_rate, new_freq=output_sample_rate
-            )
-            vib = resampler(vib)
+            vib = self._output_resampler(output_sample_rate)(vib)
             print(f"   Resampled to {output_sample_rate}Hz.")
         # vib_max = vib.abs().max()
         # if vib_max > 0:
@@ -169,22 +351,72 @@ class Model2Inference:
     def inference(self, audio_path, output_path=None, output_sample_rate=8000, max_duration=10.0):
         print(f"\nStarting inference for: {audio_path}")
         audio_tensor = self.preprocess_audio(audio_path, max_duration)
-        vib_tensor = self.generate_vibration(audio_tensor)
-        vib_output = self.postprocess_vibration(vib_tensor, output_sample_rate)
+        vib_output = self.infer_tensor(audio_tensor, output_sample_rate)
         if output_path:
             self.save_vibration(vib_output, output_path, output_sample_rate)
         print("Inference completed!")
         return vib_output
     
+    def infer_tensor(self, audio_tensor, output_sample_rate=8000):
+        """Generate and postprocess from a preprocess_audio() tensor [1, 1, T].
+
+        Both models share the same preprocessing, so a caller running them on
+        one input can decode and resample it once and pass the tensor to each.
+        """
+        vib_tensor = self.generate_vibration(audio_tensor.to(self.device))
+        return self.postprocess_vibration(vib_tensor, output_sample_rate)
+    
+    def warm_up(self, seconds=1.0, output_sample_rate=8000):
+        """Run one silent clip end to end so kernel selection, allocator growth
+        and any trace/compile happen before the first real request."""
+        silence = torch.zeros(1, 1, int(seconds * POSTPROCESS_SAMPLE_RATE), device=self.device)
+        self.infer_tensor(silence, output_sample_rate)
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+    
     def save_vibration(self, vib_tensor, output_path, sample_rate):
+        if hasattr(output_path, 'write'):
+            # In-memory target (e.g. io.BytesIO): WAV, since there is no extension to go by
+            torchaudio.save(output_path, vib_tensor.cpu(), sample_rate, format='wav')
+            return
         output_dir = os.path.dirname(output_path)
         if output_dir:  # Only create directory if there is one
             os.makedirs(output_dir, exist_ok=True)
-        torchaudio.save(output_path, vib_tensor, sample_rate)
+        torchaudio.save(output_path, vib_tensor.cpu(), sample_rate)  # the only device -> host copy
         print(f"Vibration saved to: {output_path}")
     
-    def batch_inference(self, input_folder, output_folder, output_sample_rate=8000):
-        # (This function remains the same)
+    def _audio_duration(self, audio_path):
+        """Duration in seconds from the file header (0.0 if it cannot be read)
+
+        soundfile reads the header like _load_mono does; formats libsndfile
+        cannot read (e.g. .m4a) fall back to torchaudio.info.
+        """
+        try:
+            return sf.info(str(audio_path)).duration
+        except Exception:
+            pass
+        try:
+            info = torchaudio.info(str(audio_path))
+            return info.num_frames / float(info.sample_rate)
+        except Exception as e:
+            print(f"   Could not read the duration of {audio_path}: {e}")
+            return 0.0
+
+    def _generate_padded(self, audio_tensors):
+        """One forward pass for several preprocessed [1, 1, T] tensors.
+
+        The inputs are zero-padded on the right to a common length, run as a
+        single [N, 1, T_max] batch, and each output is trimmed back to its
+        own length.
+        """
+        lengths = [t.shape[-1] for t in audio_tensors]
+        batch = torch.zeros(len(audio_tensors), 1, max(lengths), device=self.device)
+        for i, t in enumerate(audio_tensors):
+            batch[i, :, :lengths[i]] = t[0]
+        vib_pred = self.generate_vibration(batch)
+        return [vib_pred[i:i + 1, :, :lengths[i]] for i in range(len(audio_tensors))]
+
+    def batch_inference(self, input_folder, output_folder, output_sample_rate=8000, batch_size=8, max_duration=10.0):
         input_path = Path(input_folder)
         output_path = Path(output_folder)
         output_path.mkdir(parents=True, exist_ok=True)
@@ -194,18 +426,41 @@ class Model2Inference:
         
         print(f"Found {len(audio_files)} audio files in {input_folder}")
         
-        for i, audio_file in enumerate(audio_files):
-            relative_path = audio_file.relative_to(input_path)
-            output_filename = f"{audio_file.stem}-vib-model2.wav"
-            output_file_path = output_path / relative_path.parent / output_filename
-            output_file_path.parent.mkdir(parents=True, exist_ok=True)
+        # Sort by length so each padded mini-batch holds clips of similar duration
+        audio_files.sort(key=self._audio_duration)
+        
+        processed = 0
+        for start in range(0, len(audio_files), batch_size):
+            audio_tensors, targets = [], []
+            for audio_file in audio_files[start:start + batch_size]:
+                relative_path = audio_file.relative_to(input_path)
+                output_filename = f"{audio_file.stem}-vib-model2.wav"
+                output_file_path = output_path / relative_path.parent / output_filename
+                output_file_path.parent.mkdir(parents=True, exist_ok=True)
+                
+                processed += 1
+                print(f"\n[{processed}/{len(audio_files)}] Processing: {audio_file}")
+                try:
+                    audio_tensors.append(self.preprocess_audio(str(audio_file), max_duration))
+                    targets.append((audio_file, output_file_path))
+                except Exception as e:
+                    print(f"Error processing {audio_file.name}: {e}")
             
-            print(f"\n[{i+1}/{len(audio_files)}] Processing: {audio_file}")
+            if not audio_tensors:
+                continue
             try:
-                self.inference(str(audio_file), str(output_file_path), output_sample_rate)
+                vib_tensors = self._generate_padded(audio_tensors)
             except Exception as e:
-                print(f"Error processing {audio_file.name}: {e}")
+                print(f"Error processing batch of {len(audio_tensors)} files: {e}")
                 continue
+            
+            for vib_tensor, (audio_file, output_file_path) in zip(vib_tensors, targets):
+                try:
+                    vib_output = self.postprocess_vibration(vib_tensor, output_sample_rate)
+                    self.save_vibration(vib_output, str(output_file_path), output_sample_rate)
+                except Exception as e:
+                    print(f"Error processing {audio_file.name}: {e}")
+                    continue
         
         print(f"\nBatch inference completed! Results saved in: {output_folder}")
 
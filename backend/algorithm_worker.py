@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Worker side of /generate-vibrations: runs the signal-processing algorithms
+(FreqShift, HapticGen, Percept, Pitch) in pool worker processes so they run
+in parallel instead of sharing the request thread's GIL.
+"""
+
+import io
+import sys
+from pathlib import Path
+
+# Workers need the Audioalgo modules importable just like app.py does
+audioalgo_dir = Path(__file__).parent.parent / 'Audioalgo'
+if str(audioalgo_dir) not in sys.path:
+    sys.path.insert(0, str(audioalgo_dir))
+
+# Preloaded by the pool's fork server, so each worker starts with them imported
+PRELOAD_MODULES = ['algorithm_worker', 'FreqShift', 'HapticGen', 'Percept', 'PitchWrapper']
+
+_pitch_processor = None
+
+
+def init_worker(pitch_available):
+    """Import the algorithms and build per-worker state once, not per request"""
+    global _pitch_processor
+    # A failing initializer would break the whole pool; errors surface
+    # per algorithm from run_algorithm() instead
+    try:
+        import FreqShift
+        import HapticGen  # noqa: F401
+        import Percept  # noqa: F401
+        FreqShift._init_worker(250.0, 1.0)
+        if pitch_available:
+            import PitchWrapper
+            PitchWrapper._reset_engines()
+            _pitch_processor = PitchWrapper.PitchProcessor()
+    except Exception as e:
+        print(f"⚠️ Algorithm worker initialisation failed: {e}")
+
+
+def run_freqshift(in_wav, out_wav):
+    # Frequency Shifting algorithm
+    from FreqShift import process_file
+    process_file(in_wav=in_wav, out_wav=out_wav, centre_hz=250.0, q=1.0)
+    return True
+
+
+def run_hapticgen(in_wav, out_wav):
+    # HapticGen algorithm
+    from HapticGen import process_file
+    process_file(input_path=in_wav, output_path=out_wav)
+    return True
+
+
+def run_percept(in_wav, out_wav):
+    # Percept algorithm (perceptual audio-to-vibration translation)
+    from Percept import process_file
+    # One FFT thread: the other algorithms run in the neighbouring workers
+    process_file(in_wav=in_wav, out_wav=out_wav, overlap=0.0, content="game", workers=1)  # Default to game content type
+    return True
+
+
+def run_pitch(in_wav, out_wav):
+    # Pitch algorithm (Python-based sound-to-touch crossmodal pitch matching)
+    global _pitch_processor
+    if _pitch_processor is None:
+        from PitchWrapper import PitchProcessor
+        _pitch_processor = PitchProcessor()
+    return _pitch_processor.process_file(in_wav, out_wav)
+
+
+ALGORITHMS = {
+    'freqshift': run_freqshift,
+    'hapticgen': run_hapticgen,
+    'percept': run_percept,
+    'pitch': run_pitch,
+}
+
+
+def run_freqshift_array(samples, sample_rate, out_wav):
+    from FreqShift import process_array
+    process_array(samples, sample_rate, out_wav, centre_hz=250.0, q=1.0)
+    return True
+
+
+def run_hapticgen_array(samples, sample_rate, out_wav):
+    from HapticGen import process_array
+    process_array(samples, sample_rate, out_wav)
+    return True
+
+
+def run_percept_array(samples, sample_rate, out_wav):
+    from Percept import process_array
+    process_array(samples, sample_rate, out_wav, overlap=0.0, content="game", workers=1)
+    return True
+
+
+def run_pitch_array(samples, sample_rate, out_wav):
+    global _pitch_processor
+    if _pitch_processor is None:
+        from PitchWrapper import PitchProcessor
+        _pitch_processor = PitchProcessor()
+    return _pitch_processor.process_array(samples, sample_rate, out_wav)
+
+
+# Same algorithms on input the backend has already decoded
+ARRAY_ALGORITHMS = {
+    'freqshift': run_freqshift_array,
+    'hapticgen': run_hapticgen_array,
+    'percept': run_percept_array,
+    'pitch': run_pitch_array,
+}
+
+
+def warm_up(pitch_available, sample_rate=44100):
+    """
+    Run every algorithm once on a second of quiet tones and noise so numba
+    compiles (or loads from its cache) the kernels and the lru_cached filter
+    designs are filled before the first request. Done in the backend process; the @njit
+    kernels are cache=True, so pool workers load the compiled code from
+    numba's cache rather than compiling it themselves.
+    """
+    import numpy as np
+
+    # Not silence: HapticGen divides by the peak RMS, and Percept skips silent
+    # blocks, so its roughness kernel would never run
+    t = np.arange(sample_rate) / sample_rate
+    rng = np.random.default_rng(0)
+    signal = 0.1 * (np.sin(2 * np.pi * 220.0 * t) + 0.5 * np.sin(2 * np.pi * 233.0 * t)) \
+        + 0.01 * rng.standard_normal(sample_rate)
+    signal = signal.astype(np.float32)
+    for name in ARRAY_ALGORITHMS:
+        if name == 'pitch' and not pitch_available:
+            continue
+        try:
+            run_algorithm_array(name, signal, sample_rate)
+        except Exception as e:
+            print(f"⚠️ {name} warm-up failed: {e}")
+
+
+def run_algorithm(name, in_wav):
+    """Entry point submitted to the pool: returns (success, generated WAV bytes)"""
+    output = io.BytesIO()
+    success = ALGORITHMS[name](in_wav, output)
+    return success, output.getvalue()
+
+
+def run_algorithm_array(name, samples, sample_rate):
+    """
+    run_algorithm() on decoded float32 samples. Process pools are passed the
+    path of a .npy file instead, which every worker maps read-only rather
+    than unpickling its own copy of the array.
+    """
+    if isinstance(samples, str):
+        import numpy as np
+        samples = np.load(samples, mmap_mode='r')
+    output = io.BytesIO()
+    success = ARRAY_ALGORITHMS[name](samples, sample_rate, output)
+    return success, output.getvalue()
@@ -4,6 +4,8 @@ Flask backend service for Audio-Vibration Rating Explorer
 Integrates the Python algorithms for vibration generation
 """
 
+import io
+import json
 import os
 import tempfile
 import shutil
@@ -11,10 +13,20 @@ import signal
 import threading
 import hashlib
 import time
+import uuid
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from binascii import b2a_base64
 from pathlib import Path
-from flask import Flask, request, jsonify, send_file, send_from_directory
+from flask import Flask, Response, request, jsonify, send_file, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import werkzeug
+import numpy as np
+import soundfile as sf
 import sys
 
 # Add the Audioalgo directory to the Python path
@@ -22,6 +34,45 @@ current_dir = Path(__file__).parent
 audioalgo_dir = current_dir.parent / 'Audioalgo'
 sys.path.insert(0, str(audioalgo_dir))
 
+# Optional faster JSON encoder (C) for jsonify() and the streamed responses
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+if ORJSON_AVAILABLE:
+    class OrjsonProvider(DefaultJSONProvider):
+        """Flask JSON provider encoding with orjson; anything orjson rejects goes to Flask's encoder"""
+        def dumps(self, obj, **kwargs):
+            try:
+                return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS).decode()
+            except TypeError:
+                return super().dumps(obj, **kwargs)
+
+# Optional SIMD base64 encoder (libbase64) for the streamed result data
+try:
+    import pybase64
+    PYBASE64_AVAILABLE = True
+except ImportError:
+    PYBASE64_AVAILABLE = False
+
+def b64encode_chunk(chunk):
+    """Base64 text of a bytes-like chunk, without a trailing newline"""
+    if PYBASE64_AVAILABLE:
+        return pybase64.b64encode(chunk).decode('ascii')
+    return b2a_base64(chunk, newline=False).decode('ascii')
+
+def json_dumps(obj):
+    """Compact JSON text for the pieces of streamed responses"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+# Process-pool entry points for /generate-vibrations
+sys.path.insert(0, str(current_dir))
+import algorithm_worker
+
 # Import the algorithms
 try:
     from FreqShift import process_file as freqshift_process
@@ -52,22 +103,15 @@ except ImportError as e:
 # Try to import Python Pitch algorithm
 # Note: This is now a pure Python implementation, no MATLAB required
 try:
-    from Pitch import process_audio_file, get_config
+    from PitchWrapper import PitchProcessor
+    # One processor (and config) for the life of the worker instead of one per request
+    pitch_processor = PitchProcessor()
+    
+    def pitch_process(in_wav, out_wav):
+        return pitch_processor.process_file(in_wav, out_wav)
     PITCH_AVAILABLE = True
     print("✅ Successfully imported Python Pitch algorithm")
-    
-    # Create a wrapper function that matches the expected interface
-    def pitch_process(in_wav, out_wav, **kwargs):
-        """Wrapper function to match the expected interface"""
-        try:
-            config = get_config()
-            success, result = process_audio_file(in_wav, out_wav, config)
-            return success
-        except Exception as e:
-            print(f"❌ Error in Python Pitch algorithm: {e}")
-            return False
-            
-except ImportError as e:
+except (ImportError, RuntimeError) as e:
     print(f"⚠️ Python Pitch algorithm not available - Pitch algorithm will be disabled")
     print(f"   Error details: {e}")
     print("   This may be due to missing dependencies (numpy, scipy, soundfile, mosqito).")
@@ -79,6 +123,8 @@ except ImportError as e:
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+if ORJSON_AVAILABLE:
+    app.json = OrjsonProvider(app)
 
 # Production configuration
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
@@ -89,18 +135,24 @@ PROJECT_ROOT = Path(__file__).parent.parent
 AUDIO_DIR = PROJECT_ROOT / 'audio_vibration' / 'audio'
 VIBRATION_DIR = PROJECT_ROOT / 'audio_vibration' / 'vibration'
 
+def count_wav_files(directory):
+    """Count the .wav files in a directory with a single scandir pass"""
+    if not directory.exists():
+        return 0
+    with os.scandir(directory) as it:
+        return sum(1 for entry in it
+                   if entry.name.endswith('.wav') and entry.is_file(follow_symlinks=False))
+
 # Check if directories exist
 print(f"🔍 Checking audio directory: {AUDIO_DIR}")
 print(f"   Exists: {AUDIO_DIR.exists()}")
 if AUDIO_DIR.exists():
-    audio_files = list(AUDIO_DIR.glob('*.wav'))
-    print(f"   Audio files found: {len(audio_files)}")
+    print(f"   Audio files found: {count_wav_files(AUDIO_DIR)}")
 
 print(f"🔍 Checking vibration directory: {VIBRATION_DIR}")
 print(f"   Exists: {VIBRATION_DIR.exists()}")
 if VIBRATION_DIR.exists():
-    vibration_files = list(VIBRATION_DIR.glob('*.wav'))
-    print(f"   Vibration files found: {len(vibration_files)}")
+    print(f"   Vibration files found: {count_wav_files(VIBRATION_DIR)}")
 
 # Security headers for production
 @app.after_request
@@ -138,62 +190,312 @@ if NEURAL_MODELS_AVAILABLE:
         print(f"❌ Error initializing neural network models: {e}")
         NEURAL_MODELS_AVAILABLE = False
 
+# Warm the models up at import (before gunicorn forks when preloading) so the
+# first request does not pay for kernel selection and lazy initialisation
+if os.getenv('MODEL_WARMUP', '1') != '0':
+    for label, model in (('Model 1', model1_inference), ('Model 2', model2_inference)):
+        if model is None:
+            continue
+        try:
+            start = time.time()
+            model.warm_up()
+            print(f"✅ {label} warmed up in {time.time() - start:.1f}s")
+        except Exception as e:
+            print(f"⚠️ {label} warm-up failed: {e}")
+
 # Configuration
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
 
-# Simple in-memory cache for generated vibrations
-vibration_cache = {}
+# Uploads are cut to this many seconds before any algorithm runs (0 = no limit);
+# the neural models already stop at 10 s
+MAX_AUDIO_SECONDS = float(os.getenv('MAX_AUDIO_SECONDS', '10'))
+
+# Per-request scratch directories (algorithm outputs, non-libsndfile uploads)
+# live in RAM when a tmpfs is available
+TMPFS_DIR = '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else None
+
+# In-memory LRU cache of generated vibrations, keyed by upload content, so a
+# re-submitted clip is answered without running the algorithm again. The
+# generated WAV bytes are cached (the per-request temp dirs do not outlive
+# the request).
+vibration_cache = OrderedDict()
+vibration_cache_lock = threading.Lock()
 CACHE_MAX_SIZE = 100  # Maximum number of cached items
+CACHE_MAX_BYTES = 256 * 1024 * 1024  # Maximum total size of cached WAV data
 CACHE_EXPIRY = 3600  # Cache expiry time in seconds (1 hour)
 
-def get_file_hash(file_path):
+def get_file_hash(audio_bytes):
     """Generate a hash for the file content"""
-    hasher = hashlib.md5()
-    with open(file_path, 'rb') as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hasher.update(chunk)
-    return hasher.hexdigest()
+    return hashlib.blake2b(audio_bytes, digest_size=16).hexdigest()
 
-def get_cache_key(file_path, algorithm):
+def get_cache_key(file_hash, algorithm):
     """Generate a cache key for the file and algorithm combination"""
-    file_hash = get_file_hash(file_path)
     return f"{algorithm}_{file_hash}"
 
 def cleanup_cache():
-    """Remove expired entries from cache"""
+    """Remove expired entries, then the least recently used ones over the limits"""
     current_time = time.time()
-    expired_keys = []
-    for key, value in vibration_cache.items():
-        if current_time - value['timestamp'] > CACHE_EXPIRY:
-            expired_keys.append(key)
-    
+    expired_keys = [key for key, value in vibration_cache.items()
+                    if current_time - value['timestamp'] > CACHE_EXPIRY]
     for key in expired_keys:
         del vibration_cache[key]
     
-    # If cache is still too large, remove oldest entries
-    if len(vibration_cache) > CACHE_MAX_SIZE:
-        sorted_items = sorted(vibration_cache.items(), key=lambda x: x[1]['timestamp'])
-        items_to_remove = len(vibration_cache) - CACHE_MAX_SIZE
-        for i in range(items_to_remove):
-            del vibration_cache[sorted_items[i][0]]
-
-def get_cached_vibration(file_path, algorithm):
-    """Get cached vibration if available"""
-    cache_key = get_cache_key(file_path, algorithm)
-    if cache_key in vibration_cache:
-        entry = vibration_cache[cache_key]
-        if time.time() - entry['timestamp'] < CACHE_EXPIRY:
-            return entry['file_path']
+    total_bytes = sum(len(value['data']) for value in vibration_cache.values())
+    while vibration_cache and (len(vibration_cache) > CACHE_MAX_SIZE or total_bytes > CACHE_MAX_BYTES):
+        _, oldest = vibration_cache.popitem(last=False)
+        total_bytes -= len(oldest['data'])
+
+def get_cached_vibration(file_hash, algorithm):
+    """Get cached vibration WAV bytes if available"""
+    cache_key = get_cache_key(file_hash, algorithm)
+    with vibration_cache_lock:
+        entry = vibration_cache.get(cache_key)
+        if entry is not None and time.time() - entry['timestamp'] < CACHE_EXPIRY:
+            vibration_cache.move_to_end(cache_key)
+            return entry['data']
     return None
 
-def cache_vibration(file_path, algorithm, output_path):
-    """Cache the generated vibration"""
-    cleanup_cache()
-    cache_key = get_cache_key(file_path, algorithm)
-    vibration_cache[cache_key] = {
-        'file_path': str(output_path),
-        'timestamp': time.time()
-    }
+def cache_vibration(file_hash, algorithm, data):
+    """Cache the generated vibration WAV bytes"""
+    cache_key = get_cache_key(file_hash, algorithm)
+    with vibration_cache_lock:
+        vibration_cache[cache_key] = {
+            'data': data,
+            'timestamp': time.time()
+        }
+        vibration_cache.move_to_end(cache_key)
+        cleanup_cache()
+
+# Optional nginx offload for /generate-and-download: when VIBRATION_ACCEL_DIR
+# is set, the generated file is written there and nginx sends it (sendfile)
+# in response to an X-Accel-Redirect header, e.g.
+#     location /_vib/ { internal; alias /var/vib_out/; sendfile on; tcp_nopush on; }
+VIBRATION_ACCEL_DIR = os.getenv('VIBRATION_ACCEL_DIR')
+VIBRATION_ACCEL_URI = os.getenv('VIBRATION_ACCEL_URI', '/_vib/')
+ACCEL_FILE_MAX_AGE = 60  # seconds an offloaded file is kept for nginx to send
+
+def accel_janitor():
+    """Remove offloaded files once nginx has had time to send them"""
+    while True:
+        time.sleep(ACCEL_FILE_MAX_AGE / 2)
+        cutoff = time.time() - ACCEL_FILE_MAX_AGE
+        try:
+            with os.scandir(VIBRATION_ACCEL_DIR) as it:
+                for entry in it:
+                    if entry.name.endswith('.wav') and entry.stat().st_mtime < cutoff:
+                        try:
+                            os.unlink(entry.path)
+                        except FileNotFoundError:
+                            pass
+        except OSError as e:
+            print(f"⚠️ Error cleaning {VIBRATION_ACCEL_DIR}: {e}")
+
+if VIBRATION_ACCEL_DIR:
+    os.makedirs(VIBRATION_ACCEL_DIR, exist_ok=True)
+    threading.Thread(target=accel_janitor, name='accel-janitor', daemon=True).start()
+    print(f"✅ Downloads offloaded to nginx via {VIBRATION_ACCEL_URI} ({VIBRATION_ACCEL_DIR})")
+
+def download_response(data, download_name):
+    """Attachment response for generated WAV bytes"""
+    if VIBRATION_ACCEL_DIR:
+        name = f'{uuid.uuid4().hex}.wav'
+        (Path(VIBRATION_ACCEL_DIR) / name).write_bytes(data)
+        response = Response(mimetype='audio/wav')
+        response.headers['X-Accel-Redirect'] = VIBRATION_ACCEL_URI.rstrip('/') + '/' + name
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+        return response
+    return send_file(
+        io.BytesIO(data),
+        mimetype='audio/wav',
+        as_attachment=True,
+        download_name=download_name,
+        conditional=True
+    )
+
+B64_CHUNK = 49152  # multiple of 3, so the encoded chunks concatenate into one base64 string
+
+def stream_results_json(payload, file_data):
+    """
+    Yield payload as JSON with an added "results" object, base64-encoding each
+    result's raw 'data' bytes chunk by chunk instead of building the encoded
+    strings and the whole JSON document in memory.
+    """
+    yield json_dumps(payload)[:-1] + ', "results": {'
+    for i, (algorithm, entry) in enumerate(file_data.items()):
+        separator = ', ' if i else ''
+        if 'data' not in entry:
+            yield f'{separator}{json_dumps(algorithm)}: {json_dumps(entry)}'
+            continue
+        yield (f'{separator}{json_dumps(algorithm)}: {{"filename": {json_dumps(entry["filename"])}, '
+               f'"size": {entry["size"]}, "data": "')
+        data = memoryview(entry['data'])
+        for start in range(0, len(data), B64_CHUNK):
+            yield b64encode_chunk(data[start:start + B64_CHUNK])
+        yield '"}'
+    yield '}}'
+
+def stream_results_multipart(payload, file_data, boundary):
+    """
+    Yield payload as a multipart/form-data body: a "meta" JSON part (the
+    payload plus each result's filename/size or error) followed by one part
+    per generated file carrying the raw WAV bytes, so nothing is base64-encoded.
+    """
+    delimiter = f'--{boundary}\r\n'.encode('ascii')
+    meta = dict(payload, results={
+        algorithm: {key: value for key, value in entry.items() if key != 'data'}
+        for algorithm, entry in file_data.items()
+    })
+    yield (delimiter + b'Content-Disposition: form-data; name="meta"\r\n'
+           b'Content-Type: application/json\r\n\r\n' + json_dumps(meta).encode() + b'\r\n')
+    for algorithm, entry in file_data.items():
+        if 'data' not in entry:
+            continue
+        filename = entry['filename'].replace('"', '%22')
+        yield (delimiter + f'Content-Disposition: form-data; name="{algorithm}"; filename="{filename}"\r\n'
+               'Content-Type: audio/wav\r\n\r\n'.encode())
+        yield entry['data']
+        yield b'\r\n'
+    yield f'--{boundary}--\r\n'.encode('ascii')
+
+def results_response(payload, file_data):
+    """
+    Stream the generated files as multipart/form-data when the client accepts
+    it (read with response.formData()); otherwise as JSON with base64 data.
+    """
+    accepted = request.accept_mimetypes
+    if accepted['multipart/form-data'] > accepted['application/json']:
+        boundary = uuid.uuid4().hex
+        return Response(stream_results_multipart(payload, file_data, boundary),
+                        mimetype=f'multipart/form-data; boundary={boundary}')
+    return Response(stream_results_json(payload, file_data), mimetype='application/json')
+
+def upload_bytes(file):
+    """
+    The uploaded file's content. Werkzeug keeps small uploads in a BytesIO
+    (or a SpooledTemporaryFile that has not rolled over to disk yet), whose
+    buffer is returned without another read pass; larger uploads spooled to
+    disk are read once.
+    """
+    stream = file.stream
+    buffer = getattr(stream, '_file', stream)
+    if isinstance(buffer, io.BytesIO):
+        return buffer.getvalue()
+    stream.seek(0)
+    return stream.read()
+
+def audio_input(audio_bytes, temp_path):
+    """
+    Return a callable giving each algorithm its own view of the upload.
+
+    Uploads libsndfile can decode (WAV, FLAC, OGG, MP3) are read straight from
+    memory; anything else (e.g. M4A, which goes through audioread/ffmpeg and
+    needs a real file) is written to the temporary directory once.
+
+    Decodable uploads longer than MAX_AUDIO_SECONDS are cut to that length
+    here, once, so no algorithm reads or processes the discarded tail.
+    """
+    try:
+        info = sf.info(io.BytesIO(audio_bytes))
+    except Exception:
+        input_path = temp_path / 'input_audio.wav'
+        input_path.write_bytes(audio_bytes)
+        return lambda: str(input_path)
+    
+    max_frames = int(MAX_AUDIO_SECONDS * info.samplerate)
+    if MAX_AUDIO_SECONDS > 0 and info.frames > max_frames:
+        data, sr = sf.read(io.BytesIO(audio_bytes), frames=max_frames, dtype='float32', always_2d=True)
+        trimmed = io.BytesIO()
+        sf.write(trimmed, data, sr, format='WAV', subtype='FLOAT')
+        audio_bytes = trimmed.getvalue()
+        print(f"   Trimmed upload from {info.duration:.1f}s to {MAX_AUDIO_SECONDS:g}s")
+    return lambda: io.BytesIO(audio_bytes)
+
+def decode_input(source):
+    """
+    The upload decoded once, as float32 samples shared by every algorithm
+    and both models; (None, None) when libsndfile cannot read it.
+    """
+    try:
+        return sf.read(source, dtype='float32')
+    except Exception:
+        return None, None
+
+# Signal-processing algorithms run by /generate-vibrations, in response order
+SIGNAL_ALGORITHMS = ['freqshift', 'hapticgen', 'percept', 'pitch']
+ALGORITHM_LABELS = {'freqshift': 'FreqShift', 'hapticgen': 'HapticGen', 'percept': 'Percept', 'pitch': 'Pitch'}
+ALGORITHM_TIMEOUT = 120  # seconds for the whole /generate-vibrations batch
+ALGORITHM_WORKERS = min(len(SIGNAL_ALGORITHMS), os.cpu_count() or 1)
+
+_algorithm_pool = None
+_algorithm_pool_lock = threading.Lock()
+
+def algorithm_pool():
+    """
+    Pool shared across requests for the signal-processing algorithms.
+
+    Worker processes give each algorithm its own interpreter (no GIL
+    contention). They are forked from a forkserver, a single-threaded
+    process that preloads algorithm_worker and the algorithms: forking this
+    (multi-threaded, model-holding) process directly could deadlock children
+    on locks held by other request threads.
+    Every new worker still re-runs the main script (as __mp_main__), so when
+    this module itself is the script (`python app.py`) it would load the
+    neural models again in each worker; run it through serve.py or gunicorn
+    instead. In that case, and where forkserver is unavailable, threads are
+    used.
+    A pool broken by a crashed worker, or stuck on a timed-out task, is
+    replaced through discard_algorithm_pool().
+    """
+    global _algorithm_pool
+    with _algorithm_pool_lock:
+        if _algorithm_pool is not None:
+            return _algorithm_pool
+        if __name__ != '__main__' and 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(algorithm_worker.PRELOAD_MODULES)
+            _algorithm_pool = ProcessPoolExecutor(
+                max_workers=ALGORITHM_WORKERS,
+                mp_context=context,
+                initializer=algorithm_worker.init_worker,
+                initargs=(PITCH_AVAILABLE,)
+            )
+        else:
+            _algorithm_pool = ThreadPoolExecutor(
+                max_workers=ALGORITHM_WORKERS,
+                thread_name_prefix='algorithm',
+                initializer=algorithm_worker.init_worker,
+                initargs=(PITCH_AVAILABLE,)
+            )
+        return _algorithm_pool
+
+def discard_algorithm_pool(pool):
+    """
+    Stop handing out pool (if it is still the current one) so the next
+    algorithm_pool() call builds a fresh one; queued tasks are cancelled and
+    running ones are left to finish in the old workers.
+    """
+    global _algorithm_pool
+    with _algorithm_pool_lock:
+        if _algorithm_pool is pool:
+            _algorithm_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def submit_algorithm(pool, fn, *args):
+    """Submit to pool, or to a replacement if a crashed worker has broken it"""
+    try:
+        return pool.submit(fn, *args)
+    except BrokenProcessPool:
+        print("⚠️ Algorithm pool broken by a crashed worker, starting a new one")
+        discard_algorithm_pool(pool)
+        return algorithm_pool().submit(fn, *args)
+
+# Compile the numba kernels and fill the filter caches now, so the first
+# request does not pay for it; pool workers load the compiled kernels from
+# numba's on-disk cache instead of compiling them again
+if os.getenv('ALGORITHM_WARMUP', '1') != '0':
+    start = time.time()
+    algorithm_worker.warm_up(PITCH_AVAILABLE)
+    print(f"✅ Algorithms warmed up in {time.time() - start:.1f}s")
 
 # Static file serving routes
 @app.route('/audio/<filename>')
@@ -207,7 +509,7 @@ def serve_audio(filename):
         if not file_path.exists():
             return jsonify({'error': f'Audio file not found: {filename}'}), 404
         
-        return send_file(str(file_path), mimetype='audio/wav')
+        return send_file(str(file_path), mimetype='audio/wav', conditional=True)
     except Exception as e:
         print(f"Error serving audio file {filename}: {e}")
         return jsonify({'error': f'Error serving audio file: {str(e)}'}), 500
@@ -223,14 +525,29 @@ def serve_vibration(filename):
         if not file_path.exists():
             return jsonify({'error': f'Vibration file not found: {filename}'}), 404
         
-        return send_file(str(file_path), mimetype='audio/wav')
+        return send_file(str(file_path), mimetype='audio/wav', conditional=True)
     except Exception as e:
         print(f"Error serving vibration file {filename}: {e}")
         return jsonify({'error': f'Error serving vibration file: {str(e)}'}), 500
 
+# /health is polled often; its encoded payload is rebuilt at most every
+# HEALTH_CACHE_TTL seconds (the directory scans are the costly part)
+HEALTH_CACHE_TTL = 30
+_health_payload = None
+_health_payload_time = 0.0
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint with accurate model status"""
+    global _health_payload, _health_payload_time
+    now = time.monotonic()
+    if _health_payload is None or now - _health_payload_time > HEALTH_CACHE_TTL:
+        _health_payload = app.json.dumps(health_status())
+        _health_payload_time = now
+    return Response(_health_payload, mimetype='application/json')
+
+def health_status():
+    """Model status and file-serving information reported by /health"""
     algorithms = ['freqshift', 'hapticgen', 'percept']
     if PITCH_AVAILABLE:
         algorithms.append('pitch')
@@ -244,7 +561,7 @@ def health_check():
     if model2_available:
         algorithms.append('model2')
     
-    return jsonify({
+    return {
         'status': 'healthy',
         'algorithms': algorithms,
         'pitch_available': PITCH_AVAILABLE,
@@ -259,10 +576,10 @@ def health_check():
             'audio_directory_exists': AUDIO_DIR.exists(),
             'vibration_directory': str(VIBRATION_DIR),
             'vibration_directory_exists': VIBRATION_DIR.exists(),
-            'audio_files_count': len(list(AUDIO_DIR.glob('*.wav'))) if AUDIO_DIR.exists() else 0,
-            'vibration_files_count': len(list(VIBRATION_DIR.glob('*.wav'))) if VIBRATION_DIR.exists() else 0
+            'audio_files_count': count_wav_files(AUDIO_DIR),
+            'vibration_files_count': count_wav_files(VIBRATION_DIR)
         }
-    })
+    }
 
 @app.route('/generate-vibrations', methods=['POST'])
 def generate_vibrations():
@@ -281,117 +598,125 @@ def generate_vibrations():
             return jsonify({'error': 'Unsupported file format. Please use WAV, MP3, OGG, FLAC, or M4A'}), 400
         
         # Create temporary directory for processing
-        with tempfile.TemporaryDirectory() as temp_dir:
+        with tempfile.TemporaryDirectory(dir=TMPFS_DIR) as temp_dir:
             temp_path = Path(temp_dir)
             
-            # Save uploaded file
-            input_path = temp_path / 'input_audio.wav'
-            file.save(str(input_path))
+            # Keep the upload in memory
+            audio_bytes = upload_bytes(file)
             
-            # Convert to WAV if needed (you might want to add audio conversion here)
-            # For now, we'll assume it's already WAV or can be processed directly
+            # Outputs already generated for an earlier upload of the same clip
+            file_hash = get_file_hash(audio_bytes)
+            cached = {}
+            for name in SIGNAL_ALGORITHMS + ['model1', 'model2']:
+                data = get_cached_vibration(file_hash, name)
+                if data is not None:
+                    cached[name] = {
+                        'filename': f'{name}_{file.filename}',
+                        'size': len(data),
+                        'data': data
+                    }
+            if cached:
+                print(f"Using cached vibrations for {', '.join(cached)}")
             
-            # Generate vibrations using both algorithms
-            results = {}
+            # Inspect, trim and decode the upload only if something still has
+            # to be generated from it
+            open_input, samples, sample_rate = None, None, None
+            pending = [name for name in SIGNAL_ALGORITHMS
+                       if name not in cached and (name != 'pitch' or PITCH_AVAILABLE)]
+            pending += [name for name, model in (('model1', model1_inference), ('model2', model2_inference))
+                        if model is not None and name not in cached]
+            if pending:
+                open_input = audio_input(audio_bytes, temp_path)
+                samples, sample_rate = decode_input(open_input())
             
-            try:
-                # Frequency Shifting algorithm
-                freqshift_output = temp_path / 'freqshift_output.wav'
-                freqshift_process(
-                    in_wav=str(input_path),
-                    out_wav=str(freqshift_output),
-                    centre_hz=250.0,
-                    q=1.0
-                )
-                
-                if freqshift_output.exists():
-                    results['freqshift'] = {
-                        'filename': f'freqshift_{file.filename}',
-                        'path': str(freqshift_output),
-                        'size': freqshift_output.stat().st_size
-                    }
-                
-            except Exception as e:
-                print(f"Error in FreqShift algorithm: {e}")
-                results['freqshift'] = {'error': str(e)}
+            def generated(name, data):
+                """Result entry for freshly generated WAV bytes, cached for repeat uploads"""
+                cache_vibration(file_hash, name, data)
+                return {'filename': f'{name}_{file.filename}', 'size': len(data), 'data': data}
             
-            try:
-                # HapticGen algorithm
-                hapticgen_output = temp_path / 'hapticgen_output.wav'
-                hapticgen_process(
-                    input_path=str(input_path),
-                    output_path=str(hapticgen_output)
-                )
-                
-                if hapticgen_output.exists():
-                    results['hapticgen'] = {
-                        'filename': f'hapticgen_{file.filename}',
-                        'path': str(hapticgen_output),
-                        'size': hapticgen_output.stat().st_size
-                    }
-                
-            except Exception as e:
-                print(f"Error in HapticGen algorithm: {e}")
-                results['hapticgen'] = {'error': str(e)}
+            # Generate vibrations with the signal-processing algorithms. They
+            # are independent, so they run in parallel in the worker pool.
+            outcomes = {}
+            futures = {}
+            pool = algorithm_pool()
+            shared_samples = None
+            for name in SIGNAL_ALGORITHMS:
+                if name in cached or (name == 'pitch' and not PITCH_AVAILABLE):
+                    continue
+                if samples is None:
+                    futures[submit_algorithm(pool, algorithm_worker.run_algorithm, name, open_input())] = name
+                    continue
+                if shared_samples is None:
+                    # Worker processes map one copy of the samples from the
+                    # (tmpfs) temp directory; threads share the array itself
+                    shared_samples = samples
+                    if isinstance(pool, ProcessPoolExecutor):
+                        shared_samples = str(temp_path / 'input_audio.npy')
+                        np.save(shared_samples, samples)
+                futures[submit_algorithm(pool, algorithm_worker.run_algorithm_array, name, shared_samples, sample_rate)] = name
             
             try:
-                # Percept algorithm (perceptual audio-to-vibration translation)
-                percept_output = temp_path / 'percept_output.wav'
-                percept_process(
-                    in_wav=str(input_path),
-                    out_wav=str(percept_output),
-                    overlap=0.0,
-                    content="game"  # Default to game content type
-                )
-                
-                if percept_output.exists():
-                    results['percept'] = {
-                        'filename': f'percept_{file.filename}',
-                        'path': str(percept_output),
-                        'size': percept_output.stat().st_size
-                    }
-                
-            except Exception as e:
-                print(f"Error in Percept algorithm: {e}")
-                results['percept'] = {'error': str(e)}
+                for future in as_completed(futures, timeout=ALGORITHM_TIMEOUT):
+                    name = futures[future]
+                    try:
+                        outcomes[name] = future.result()  # (success, WAV bytes)
+                    except Exception as e:
+                        print(f"Error in {ALGORITHM_LABELS[name]} algorithm: {e}")
+                        outcomes[name] = e
+            except FutureTimeoutError:
+                for future, name in futures.items():
+                    if name not in outcomes:
+                        print(f"Timeout in {ALGORITHM_LABELS[name]} algorithm")
+                        outcomes[name] = TimeoutError(f'{ALGORITHM_LABELS[name]} algorithm timed out')
+                # A running task cannot be cancelled; leave its workers to it
+                # rather than letting later requests queue behind them
+                discard_algorithm_pool(pool)
             
-            try:
-                # Pitch algorithm (Python-based sound-to-touch crossmodal pitch matching)
-                if PITCH_AVAILABLE:
-                    pitch_output = temp_path / 'pitch_output.wav'
-                    success = pitch_process(
-                        in_wav=str(input_path),
-                        out_wav=str(pitch_output)
-                    )
-                    
-                    if success and pitch_output.exists():
-                        results['pitch'] = {
-                            'filename': f'pitch_{file.filename}',
-                            'path': str(pitch_output),
-                            'size': pitch_output.stat().st_size
-                        }
-                    else:
-                        results['pitch'] = {'error': 'Pitch algorithm failed to generate output'}
-                else:
+            results = {}
+            for name in SIGNAL_ALGORITHMS:
+                outcome = outcomes.get(name)
+                if name in cached:
+                    results[name] = cached[name]
+                elif name == 'pitch' and not PITCH_AVAILABLE:
                     results['pitch'] = {'error': 'Pitch algorithm requires Python dependencies (numpy, scipy, soundfile, mosqito) - not available'}
-                
-            except Exception as e:
-                print(f"Error in Pitch algorithm: {e}")
-                results['pitch'] = {'error': str(e)}
+                elif isinstance(outcome, Exception):
+                    results[name] = {'error': str(outcome)}
+                elif outcome is not None and outcome[0] and outcome[1]:
+                    results[name] = generated(name, outcome[1])
+                elif name == 'pitch':
+                    results['pitch'] = {'error': 'Pitch algorithm failed to generate output'}
+            
+            # Both neural models take the same preprocessed input (24 kHz mono,
+            # peak-normalised), so the upload is resampled once
+            model_input = None
+            uncached_models = [model for name, model in (('model1', model1_inference), ('model2', model2_inference))
+                               if model is not None and name not in cached]
+            if uncached_models:
+                preprocessor = uncached_models[0]
+                try:
+                    if samples is not None:
+                        model_input = preprocessor.preprocess_array(samples, sample_rate, max_duration=10.0)
+                    else:
+                        model_input = preprocessor.preprocess_audio(open_input(), max_duration=10.0)
+                except Exception as e:
+                    print(f"Error preprocessing audio for the neural models: {e}")
+            
+            def run_model(model):
+                if model_input is not None:
+                    return model.infer_tensor(model_input, output_sample_rate=8000)
+                return model.inference(open_input(), output_sample_rate=8000, max_duration=10.0)
             
             # Neural Network Model 1 (Top-Rated Sound2Hap)
-            if model1_inference is not None:
+            if 'model1' in cached:
+                results['model1'] = cached['model1']
+            elif model1_inference is not None:
                 try:
-                    model1_output = temp_path / 'model1_output.wav'
-                    vib_output = model1_inference.inference(str(input_path), output_sample_rate=8000, max_duration=10.0)
-                    model1_inference.save_vibration(vib_output, str(model1_output), 8000)
+                    model1_output = io.BytesIO()
+                    vib_output = run_model(model1_inference)
+                    model1_inference.save_vibration(vib_output, model1_output, 8000)
                     
-                    if model1_output.exists():
-                        results['model1'] = {
-                            'filename': f'model1_{file.filename}',
-                            'path': str(model1_output),
-                            'size': model1_output.stat().st_size
-                        }
+                    if model1_output.getbuffer().nbytes:
+                        results['model1'] = generated('model1', model1_output.getvalue())
                     else:
                         results['model1'] = {'error': 'Model 1 output file not generated'}
                     
@@ -402,18 +727,16 @@ def generate_vibrations():
                 results['model1'] = {'error': 'Model 1 (Top-Rated Sound2Hap) not available - model file not found or initialization failed'}
             
             # Neural Network Model 2 (Preference-Weighted Sound2Hap)
-            if model2_inference is not None:
+            if 'model2' in cached:
+                results['model2'] = cached['model2']
+            elif model2_inference is not None:
                 try:
-                    model2_output = temp_path / 'model2_output.wav'
-                    vib_output = model2_inference.inference(str(input_path), output_sample_rate=8000, max_duration=10.0)
-                    model2_inference.save_vibration(vib_output, str(model2_output), 8000)
+                    model2_output = io.BytesIO()
+                    vib_output = run_model(model2_inference)
+                    model2_inference.save_vibration(vib_output, model2_output, 8000)
                     
-                    if model2_output.exists():
-                        results['model2'] = {
-                            'filename': f'model2_{file.filename}',
-                            'path': str(model2_output),
-                            'size': model2_output.stat().st_size
-                        }
+                    if model2_output.getbuffer().nbytes:
+                        results['model2'] = generated('model2', model2_output.getvalue())
                     else:
                         results['model2'] = {'error': 'Model 2 output file not generated'}
                     
@@ -423,27 +746,13 @@ def generate_vibrations():
             else:
                 results['model2'] = {'error': 'Model 2 (Preference-Weighted Sound2Hap) not available - model file not found or initialization failed'}
             
-            # Return file data as base64 encoded strings instead of file paths
-            import base64
-            file_data = {}
-            
-            for algorithm, result in results.items():
-                if 'path' in result and Path(result['path']).exists():
-                    with open(result['path'], 'rb') as f:
-                        file_data[algorithm] = {
-                            'filename': result['filename'],
-                            'size': result['size'],
-                            'data': base64.b64encode(f.read()).decode('utf-8')
-                        }
-                elif 'error' in result:
-                    file_data[algorithm] = {'error': result['error']}
-            
-            return jsonify({
+            # Return the in-memory outputs as raw multipart parts or as
+            # base64 encoded strings, encoded while the response streams
+            return results_response({
                 'success': True,
                 'message': 'Vibration generation completed',
-                'original_file': file.filename,
-                'results': file_data
-            })
+                'original_file': file.filename
+            }, results)
             
     except Exception as e:
         print(f"Error in generate_vibrations: {e}")
@@ -454,13 +763,37 @@ def timeout_handler(signum, frame):
     """Handle timeout for long-running operations"""
     raise TimeoutError("Operation timed out")
 
+def _can_use_alarm():
+    # signal handlers can only be installed from the main thread, and
+    # threaded servers (Flask's, gunicorn gthread) run requests elsewhere
+    return hasattr(signal, 'SIGALRM') and threading.current_thread() is threading.main_thread()
+
+# Limit for one /generate-and-download algorithm run
+DOWNLOAD_TIMEOUT = 30
+
+def start_timeout(seconds):
+    """
+    Arm the SIGALRM timeout where possible (main-thread servers only). In
+    threaded servers nothing interrupts the request thread: gunicorn's
+    gthread timeout only watches the worker's heartbeat, which keeps going
+    while requests run. The signal-processing algorithms are therefore
+    bounded by running them in the algorithm pool; the neural models, which
+    run in the request thread, are only bounded by this alarm.
+    """
+    if _can_use_alarm():
+        signal.signal(signal.SIGALRM, timeout_handler)
+        signal.alarm(seconds)
+
+def cancel_timeout():
+    if _can_use_alarm():
+        signal.alarm(0)
+
 @app.route('/generate-and-download', methods=['POST'])
 def generate_and_download():
     """Generate vibration file on-demand and return it without saving"""
     try:
-        # Set a timeout for the entire operation (30 seconds)
-        signal.signal(signal.SIGALRM, timeout_handler)
-        signal.alarm(30)
+        # Set a timeout for the entire operation
+        start_timeout(DOWNLOAD_TIMEOUT)
         # Check if file is present
         if 'audio_file' not in request.files:
             return jsonify({'error': 'No audio file provided'}), 400
@@ -487,105 +820,87 @@ def generate_and_download():
             return jsonify({'error': 'Unsupported file format. Please use WAV, MP3, OGG, FLAC, or M4A'}), 400
         
         # Create temporary directory for processing
-        with tempfile.TemporaryDirectory() as temp_dir:
+        with tempfile.TemporaryDirectory(dir=TMPFS_DIR) as temp_dir:
             temp_path = Path(temp_dir)
             
-            # Save uploaded file
-            input_path = temp_path / 'input_audio.wav'
-            file.save(str(input_path))
+            # Keep the upload in memory; the algorithm reads it as a stream
+            audio_bytes = upload_bytes(file)
+            open_input = audio_input(audio_bytes, temp_path)
             
             # Check cache first
-            cached_path = get_cached_vibration(str(input_path), algorithm)
-            if cached_path and Path(cached_path).exists():
+            file_hash = get_file_hash(audio_bytes)
+            cached_data = get_cached_vibration(file_hash, algorithm)
+            if cached_data is not None:
                 print(f"Using cached vibration for {algorithm}")
-                signal.alarm(0)
-                return send_file(
-                    cached_path, 
-                    as_attachment=True, 
-                    download_name=f'{algorithm}_{file.filename}'
-                )
+                cancel_timeout()
+                return download_response(cached_data, f'{algorithm}_{file.filename}')
             
-            # Generate vibration file based on algorithm
-            output_path = temp_path / f'{algorithm}_output.wav'
+            # Generate vibration file based on algorithm, into memory
+            output_path = io.BytesIO()
             
             try:
-                if algorithm == 'freqshift':
-                    freqshift_process(
-                        in_wav=str(input_path),
-                        out_wav=str(output_path),
-                        centre_hz=250.0,
-                        q=1.0
-                    )
-                elif algorithm == 'hapticgen':
-                    hapticgen_process(
-                        input_path=str(input_path),
-                        output_path=str(output_path)
-                    )
-                elif algorithm == 'percept':
-                    percept_process(
-                        in_wav=str(input_path),
-                        out_wav=str(output_path),
-                        overlap=0.0,
-                        content="game"
-                    )
-                elif algorithm == 'pitch':
-                    if PITCH_AVAILABLE:
-                        success = pitch_process(
-                            in_wav=str(input_path),
-                            out_wav=str(output_path)
-                        )
-                        if not success:
-                            return jsonify({'error': 'Pitch algorithm failed to generate output'}), 500
-                    else:
+                if algorithm in SIGNAL_ALGORITHMS:
+                    if algorithm == 'pitch' and not PITCH_AVAILABLE:
                         return jsonify({'error': 'Pitch algorithm requires MATLAB Engine for Python (not available - this is normal if MATLAB is not installed)'}), 400
+                    # Run in the algorithm pool, which (unlike the request
+                    # thread) can be given up on when the time limit passes
+                    pool = algorithm_pool()
+                    future = submit_algorithm(pool, algorithm_worker.run_algorithm, algorithm, open_input())
+                    try:
+                        success, data = future.result(timeout=DOWNLOAD_TIMEOUT)
+                    except FutureTimeoutError:
+                        discard_algorithm_pool(pool)
+                        raise TimeoutError(f'{algorithm} algorithm timed out')
+                    if not success:
+                        return jsonify({'error': f'{ALGORITHM_LABELS[algorithm]} algorithm failed to generate output'}), 500
+                    output_path.write(data)
                 elif algorithm == 'model1':
                     if model1_inference is not None:
                         # Use optimized inference with shorter duration for faster processing
-                        vib_output = model1_inference.inference(str(input_path), output_sample_rate=8000, max_duration=10.0)
-                        model1_inference.save_vibration(vib_output, str(output_path), 8000)
+                        vib_output = model1_inference.inference(open_input(), output_sample_rate=8000, max_duration=10.0)
+                        model1_inference.save_vibration(vib_output, output_path, 8000)
                     else:
                         return jsonify({'error': 'Model 1 (Top-Rated Sound2Hap) not available - model file not found or initialization failed'}), 400
                 elif algorithm == 'model2':
                     if model2_inference is not None:
                         # Use optimized inference with shorter duration for faster processing
-                        vib_output = model2_inference.inference(str(input_path), output_sample_rate=8000, max_duration=10.0)
-                        model2_inference.save_vibration(vib_output, str(output_path), 8000)
+                        vib_output = model2_inference.inference(open_input(), output_sample_rate=8000, max_duration=10.0)
+                        model2_inference.save_vibration(vib_output, output_path, 8000)
                     else:
                         return jsonify({'error': 'Model 2 (Preference-Weighted Sound2Hap) not available - model file not found or initialization failed'}), 400
                 
-                if output_path.exists():
+                data = output_path.getvalue()
+                if data:
                     # Cache the generated vibration
-                    cache_vibration(str(input_path), algorithm, str(output_path))
+                    cache_vibration(file_hash, algorithm, data)
                     
                     # Cancel the alarm before sending the file
-                    signal.alarm(0)
-                    return send_file(
-                        str(output_path), 
-                        as_attachment=True, 
-                        download_name=f'{algorithm}_{file.filename}'
-                    )
+                    cancel_timeout()
+                    return download_response(data, f'{algorithm}_{file.filename}')
                 else:
-                    signal.alarm(0)
+                    cancel_timeout()
                     return jsonify({'error': f'Failed to generate {algorithm} vibration'}), 500
                     
             except TimeoutError:
-                signal.alarm(0)
+                cancel_timeout()
                 print(f"Timeout in {algorithm} algorithm")
                 return jsonify({'error': f'{algorithm} algorithm timed out. Please try with a shorter audio file or use a different algorithm.'}), 408
             except Exception as e:
-                signal.alarm(0)
+                cancel_timeout()
                 print(f"Error in {algorithm} algorithm: {e}")
                 return jsonify({'error': f'Algorithm error: {str(e)}'}), 500
                 
     except TimeoutError:
-        signal.alarm(0)
+        cancel_timeout()
         print("Overall timeout in generate_and_download")
         return jsonify({'error': 'Request timed out. Please try with a shorter audio file or use a different algorithm.'}), 408
     except Exception as e:
-        signal.alarm(0)
+        cancel_timeout()
         print(f"Error in generate_and_download: {e}")
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
 
 if __name__ == '__main__':
+    # Prefer `python serve.py`: run as the script, this module cannot use the
+    # algorithm process pool (see algorithm_pool())
     app.run(debug=True, host='0.0.0.0', port=8000)
\ No newline at end of file
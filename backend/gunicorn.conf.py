@@ -0,0 +1,34 @@
+"""
+Gunicorn configuration for the Flask backend:
+
+    cd backend && gunicorn -c gunicorn.conf.py app:app
+
+Threaded (gthread) workers let one process overlap several requests while
+the algorithms and models run in numpy/scipy/torch code that releases the
+GIL, instead of one request per sync worker.
+"""
+
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+# With gthread this only catches a worker whose main loop stops sending
+# heartbeats; it does not limit a request. Request time limits are enforced
+# by app.py (ALGORITHM_TIMEOUT, DOWNLOAD_TIMEOUT) through the algorithm pool.
+timeout = 120
+
+# Heartbeat files on tmpfs so a busy disk cannot stall the worker check-ins
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+# numba's on-disk cache of compiled kernels (@njit(cache=True)) on tmpfs,
+# shared by all workers; must be set before app.py imports numba
+if os.path.isdir('/dev/shm'):
+    os.environ.setdefault('NUMBA_CACHE_DIR', '/dev/shm/numba')
+
+# Load app.py (and the model weights) once in the master and share it
+# copy-on-write with the workers. A CUDA context does not survive fork, so
+# on GPU hosts each worker loads its own copy instead.
+preload_app = os.getenv('GUNICORN_PRELOAD', '0' if os.path.exists('/dev/nvidia0') else '1') == '1'
@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+"""
+Run the backend with Flask's development server:
+
+    python serve.py
+
+app.py is imported rather than run as the script: multiprocessing re-runs
+the main script in every algorithm pool worker, which for app.py would load
+and warm up the neural models again in each of them.
+"""
+
+if __name__ == '__main__':
+    from app import app
+    app.run(debug=True, host='0.0.0.0', port=8000)
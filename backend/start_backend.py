@@ -3,28 +3,100 @@
 Startup script for the Audio-Vibration Backend Service
 """
 
-import subprocess
+import hashlib
+import re
 import sys
 import os
+from importlib.metadata import PackageNotFoundError, distribution
 from pathlib import Path
 
+# SHA-256 of the requirements.txt last installed successfully
+DEPS_MARKER = ".deps.sha256"
+# Fingerprint (paths and mtimes) of the sources last compiled to bytecode
+BYTECODE_MARKER = ".bytecode.sha256"
+# Sources app.py imports, as (directory, recurse): the backend's own modules
+# (not the virtualenv kept in backend/; pip compiles site-packages itself)
+# and the Audioalgo algorithms
+SOURCE_DIRS = [(Path("."), False), (Path("..") / "Audioalgo", True)]
+SKIP_SOURCES = re.compile(r"[\\/](\.?venv|node_modules|__pycache__)[\\/]")
+
+def missing_requirements(requirements_text):
+    """
+    Distribution names from requirements.txt that are not installed. Only the
+    installed metadata is looked up, so nothing (torch in particular) is imported.
+    """
+    missing = []
+    for line in requirements_text.splitlines():
+        name = re.split(r"[\s<>=!~;\[#]", line.strip(), maxsplit=1)[0]
+        if not name:
+            continue
+        try:
+            distribution(name)
+        except PackageNotFoundError:
+            missing.append(name)
+    return missing
+
 def install_requirements():
-    """Install required packages"""
+    """Install required packages, unless requirements.txt is unchanged since the last install"""
+    requirements = Path("requirements.txt").read_bytes()
+    requirements_hash = hashlib.sha256(requirements).hexdigest()
+    marker = Path(DEPS_MARKER)
+    if marker.exists() and marker.read_text().strip() == requirements_hash:
+        missing = missing_requirements(requirements.decode())
+        if not missing:
+            print("✅ Requirements unchanged since last install, skipping pip")
+            return True
+        print(f"⚠️ Missing packages: {', '.join(missing)}")
+    
     print("📦 Installing required packages...")
+    # subprocess is only needed off the fast paths, so it is imported here
+    import subprocess
     try:
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", "requirements.txt"])
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "--disable-pip-version-check", "--no-input",
+                               "-r", "requirements.txt"])
         print("✅ Requirements installed successfully")
     except subprocess.CalledProcessError as e:
         print(f"❌ Failed to install requirements: {e}")
         return False
+    marker.write_text(requirements_hash)
     return True
 
+def prewarm_bytecode():
+    """
+    Compile the backend and Audioalgo sources to .pyc before the backend
+    starts, so its imports load cached bytecode. Skipped while no source
+    file has been added, removed or modified since the last run.
+    """
+    sources = sorted(path for directory, recurse in SOURCE_DIRS if directory.exists()
+                     for path in (directory.rglob("*.py") if recurse else directory.glob("*.py"))
+                     if not SKIP_SOURCES.search(str(path.resolve())))
+    fingerprint = hashlib.sha256(
+        "".join(f"{path}:{path.stat().st_mtime_ns}\n" for path in sources).encode()
+    ).hexdigest()
+    marker = Path(BYTECODE_MARKER)
+    if marker.exists() and marker.read_text().strip() == fingerprint:
+        return
+    
+    import compileall
+    print("⚙️ Compiling backend sources to bytecode...")
+    compiled = all([compileall.compile_dir(str(directory), maxlevels=None if recurse else 0,
+                                           quiet=1, workers=0, rx=SKIP_SOURCES)
+                    for directory, recurse in SOURCE_DIRS if directory.exists()])
+    if compiled:
+        marker.write_text(fingerprint)
+
 def start_service():
     """Start the Flask service"""
     print("🚀 Starting Audio-Vibration Backend Service...")
     try:
-        # Start the Flask app
-        subprocess.run([sys.executable, "app.py"])
+        # Start the Flask app, through serve.py so app.py is not __main__ (pool
+        # workers re-run the main script). On POSIX the launcher is replaced by
+        # it (no fork, no idle parent left waiting); Windows has no real exec.
+        if os.name == "posix":
+            sys.stdout.flush()
+            os.execv(sys.executable, [sys.executable, "serve.py"])
+        import subprocess
+        subprocess.run([sys.executable, "serve.py"])
     except KeyboardInterrupt:
         print("\n🛑 Service stopped by user")
     except Exception as e:
@@ -40,6 +112,7 @@ if __name__ == "__main__":
     
     # Install requirements if needed
     if install_requirements():
+        prewarm_bytecode()
         start_service()
     else:
         print("❌ Failed to start service due to missing requirements")